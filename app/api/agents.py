@@ -1,14 +1,22 @@
-from fastapi import APIRouter, HTTPException
-from app.models import AgentStatus, AgentStatusUpdate, CreateAgent, SerializedAgent, SerializedRun
+from datetime import datetime
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from app.models import AgentStatus, AgentStatusUpdate, CreateAgent, RunStatus, SerializedAgent, SerializedRun
 from app.services.agent_service import agent_heartbeat, create_agent, get_agent_by_id, list_agents, list_available_agents, update_agent_status
 from app.services.run_service import list_runs_by_agent
+from app.utils.http_client import agent_pool_stats
+from app.utils.pagination import PageQuery, page_query, set_page_headers
+from app.utils.serialization import ModelResponse
 
 router = APIRouter()
 
-@router.get("/")
-async def get_agents() -> list[SerializedAgent]:
+@router.get("/", response_model=list[SerializedAgent])
+async def get_agents(page: PageQuery = Depends(page_query), status: Optional[AgentStatus] = None) -> ModelResponse:
     try:
-        return await list_agents()
+        agents = await list_agents(page, status)
+        response = ModelResponse(agents)
+        set_page_headers(response, agents, page)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting agents: {e}")
 
@@ -23,27 +31,35 @@ async def register(agent: CreateAgent) -> SerializedAgent:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error registering agent: {e}")
 
-@router.get("/available")
-async def available_agents() -> list[SerializedAgent]:
+@router.get("/available", response_model=list[SerializedAgent])
+async def available_agents() -> ModelResponse:
     try:
-        return await list_available_agents()
+        return ModelResponse(await list_available_agents())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting available agents: {e}")
 
-@router.get("/{agent_id}")
-async def get_agent(agent_id: str) -> SerializedAgent:
+@router.get("/pool")
+async def agent_pool() -> dict[str, Any]:
+    return agent_pool_stats()
+
+@router.get("/{agent_id}", response_model=SerializedAgent)
+async def get_agent(agent_id: str) -> ModelResponse:
     try:
         agent = await get_agent_by_id(agent_id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
-        return agent
+        return ModelResponse(agent)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting agent: {e}")
 
-@router.get("/{agent_id}/runs")
-async def get_agent_runs(agent_id: str) -> list[SerializedRun]:
+@router.get("/{agent_id}/runs", response_model=list[SerializedRun])
+async def get_agent_runs(agent_id: str, page: PageQuery = Depends(page_query), status: Optional[RunStatus] = None,
+                         since: Optional[datetime] = None, until: Optional[datetime] = None) -> ModelResponse:
     try:
-        return await list_runs_by_agent(agent_id)
+        runs = await list_runs_by_agent(agent_id, page, status, since, until)
+        response = ModelResponse(runs)
+        set_page_headers(response, runs, page)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting runs for agent {agent_id}: {e}")
 
@@ -1,25 +1,34 @@
+from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
 
-from app.models import SerializedBot, SerializedRun
+from app.models import BotStats, BotVersion, RunPriority, RunStatus, SerializedBot, SerializedRun, StatsGranularity
+from app.utils.pagination import PageQuery, page_query, set_page_headers
+from app.utils.serialization import ModelResponse
 
 from ..models import CreateBot, UpdateBot
 from ..services.bot_service import create_bot, get_bot_by_id, list_bots, delete_bot, update_bot
+from ..services.bot_version_service import get_bot_version_script, get_script_by_hash, list_bot_versions
 from ..services.run_service import list_runs_by_bot, queue_run
+from ..services.stats_service import get_bot_stats
 
 router = APIRouter()
 
-@router.get("/")
-async def get_bots() -> list[SerializedBot]:
-    return await list_bots()
+@router.get("/", response_model=list[SerializedBot])
+async def get_bots(page: PageQuery = Depends(page_query)) -> ModelResponse:
+    bots = await list_bots(page)
+    response = ModelResponse(bots)
+    set_page_headers(response, bots, page)
+    return response
 
 @router.post("/")
 async def register_bot(bot: CreateBot) -> Optional[SerializedBot]:
     return await create_bot(bot)
 
-@router.get("/{bot_id}")
-async def get_bot(bot_id: str) -> SerializedBot:
-    return await get_bot_by_id(bot_id)
+@router.get("/{bot_id}", response_model=SerializedBot)
+async def get_bot(bot_id: str) -> ModelResponse:
+    return ModelResponse(await get_bot_by_id(bot_id))
 
 @router.put("/{bot_id}")
 async def modify_bot(bot_id: str, bot: UpdateBot) -> Optional[SerializedBot]:
@@ -32,18 +41,52 @@ async def remove_bot(bot_id: str) -> dict[str, str]:
         raise HTTPException(status_code=404, detail="Bot not found or could not be deleted")
     return {"message": "Bot deleted successfully"}
 
-@router.get("/{bot_id}/runs")
-async def get_bot_runs(bot_id: str) -> list[SerializedRun]:
+@router.get("/{bot_id}/runs", response_model=list[SerializedRun])
+async def get_bot_runs(bot_id: str, page: PageQuery = Depends(page_query), status: Optional[RunStatus] = None,
+                       since: Optional[datetime] = None, until: Optional[datetime] = None) -> ModelResponse:
     try:
-        return await list_runs_by_bot(bot_id)
+        runs = await list_runs_by_bot(bot_id, page, status, since, until)
+        response = ModelResponse(runs)
+        set_page_headers(response, runs, page)
+        return response
     except Exception as e:
         print(f"Error in get_bot_runs: {e}")
         raise HTTPException(status_code=500, detail="Internal server error") from e
 
 @router.post("/{bot_id}/runs")
-async def run_bot(bot_id: str) -> dict[str, str]:
-    run = await queue_run(bot_id)
+async def run_bot(bot_id: str, priority: RunPriority = RunPriority.NORMAL) -> dict[str, str]:
+    run = await queue_run(bot_id, priority)
     run_id = run.id
 
     return {"message": f"Bot {bot_id} is queued to run", "run_id": run_id}
 
+@router.get("/{bot_id}/stats")
+async def get_bot_run_stats(bot_id: str, granularity: StatsGranularity = StatsGranularity.HOUR,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None) -> BotStats:
+    return await get_bot_stats(bot_id, granularity, since, until)
+
+@router.get("/{bot_id}/scripts/{script_hash}")
+async def get_script(bot_id: str, script_hash: str, request: Request) -> Response:
+    # Looked up even for a matching ETag, so that scripts of deleted bots are gone
+    script = await get_script_by_hash(bot_id, script_hash)
+    if script is None:
+        raise HTTPException(status_code=404, detail="Script not found")
+    # Scripts are content addressed, so agents can cache them forever
+    headers = {"ETag": f'"{script_hash}"', "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return PlainTextResponse(script, headers=headers)
+
+@router.get("/{bot_id}/versions", response_model=list[BotVersion])
+async def get_bot_versions(bot_id: str, page: PageQuery = Depends(page_query)) -> ModelResponse:
+    versions = await list_bot_versions(bot_id, page)
+    response = ModelResponse(versions)
+    set_page_headers(response, versions, page)
+    return response
+
+@router.get("/{bot_id}/versions/{version}/script")
+async def get_bot_version(bot_id: str, version: int) -> PlainTextResponse:
+    script = await get_bot_version_script(bot_id, version)
+    if script is None:
+        raise HTTPException(status_code=404, detail="Bot version not found")
+    return PlainTextResponse(script)
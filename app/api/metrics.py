@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services.run_service import update_run_metrics
+from app.utils.metrics import render_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    try:
+        await update_run_metrics()
+    except Exception as e:
+        # Still serve the in-process metrics when Mongo is unreachable
+        print(f"[Metrics] Error counting runs by status: {e}")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,31 +1,61 @@
-from fastapi import APIRouter
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from app.models import CreateRunEvent, CreateRunLog, ObjectIdStr, RunStatus, SerializedRun, SerializedRunEvent, SerializedRunLog
-from app.services.run_event_service import create_run_event, list_run_events
-from app.services.run_log_service import create_run_log, list_run_logs
-from app.services.run_service import get_run_by_id, list_runs, update_run_status
+from app.models import (BatchIngestResult, CreateRunEvent, CreateRunLog, ExportFormat, LogLevel, ObjectIdStr, RunStatus, SerializedRun,
+                        SerializedRunEvent, SerializedRunLog)
+from app.services.archive_service import read_run_archive
+from app.services.run_event_service import create_run_event, create_run_events, list_run_events, open_run_event_screenshot
+from app.services.run_log_service import create_run_log, create_run_logs, list_run_logs
+from app.services.run_service import export_runs, get_run_by_id, list_runs, update_run_status
+from app.utils.config import BATCH_UPLOAD_CHUNK_SIZE
+from app.utils.ndjson import ingest_ndjson
+from app.utils.pagination import PageQuery, page_query, set_page_headers
+from app.utils.serialization import ModelResponse
 
 router = APIRouter()
 
 @router.get("/", response_model=list[SerializedRun])
-async def get_runs() -> list[SerializedRun]:
+async def get_runs(page: PageQuery = Depends(page_query), status: Optional[RunStatus] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None) -> ModelResponse:
     try:
-        return await list_runs()
+        runs = await list_runs(page, status, since, until)
+        response = ModelResponse(runs)
+        set_page_headers(response, runs, page)
+        return response
     except Exception as e:
         raise e
 
-@router.get("/{run_id}")
-async def get_run(run_id: str) -> SerializedRun:
+@router.get("/export")
+async def export_run_history(format: ExportFormat = ExportFormat.NDJSON, bot_id: Optional[str] = None, status: Optional[RunStatus] = None,
+                             since: Optional[datetime] = None, until: Optional[datetime] = None) -> StreamingResponse:
+    media_type = "text/csv" if format == ExportFormat.CSV else "application/x-ndjson"
+    filename = f"runs.{'csv' if format == ExportFormat.CSV else 'ndjson'}"
+    return StreamingResponse(
+        export_runs(format, since, until, bot_id, status),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/{run_id}", response_model=SerializedRun)
+async def get_run(run_id: str) -> ModelResponse:
     try:
-        return await get_run_by_id(run_id)
+        return ModelResponse(await get_run_by_id(run_id))
     except Exception as e:
         raise e
 
-@router.get("/{run_id}/logs")
-async def get_run_logs(run_id: str) -> list[SerializedRunLog]:
+@router.get("/{run_id}/logs", response_model=list[SerializedRunLog])
+async def get_run_logs(run_id: str, page: PageQuery = Depends(page_query), level: Optional[LogLevel] = None,
+                       since: Optional[datetime] = None, until: Optional[datetime] = None) -> ModelResponse:
     try:
-        return await list_run_logs(run_id)
+        logs = await list_run_logs(run_id, page, level, since, until)
+        response = ModelResponse(logs)
+        set_page_headers(response, logs, page)
+        return response
     except Exception as e:
         raise e
 
@@ -37,10 +67,20 @@ async def add_run_log(run_id: str, data: CreateRunLog) -> SerializedRunLog:
     except Exception as e:
         raise e
 
-@router.get("/{run_id}/events")
-async def get_run_events(run_id: str) -> list[SerializedRunEvent]:
+@router.post("/{run_id}/logs:batch")
+async def add_run_logs_batch(run_id: str, request: Request) -> BatchIngestResult:
+    if not ObjectId.is_valid(run_id):
+        raise HTTPException(status_code=400, detail=f"Invalid run id: {run_id}")
+    return await ingest_ndjson(request.stream(), CreateRunLog, {"run_id": run_id}, create_run_logs, BATCH_UPLOAD_CHUNK_SIZE)
+
+@router.get("/{run_id}/events", response_model=list[SerializedRunEvent])
+async def get_run_events(run_id: str, page: PageQuery = Depends(page_query), event_type: Optional[str] = None,
+                         since: Optional[datetime] = None, until: Optional[datetime] = None) -> ModelResponse:
     try:
-        return await list_run_events(run_id)
+        events = await list_run_events(run_id, page, event_type, since, until)
+        response = ModelResponse(events)
+        set_page_headers(response, events, page)
+        return response
     except Exception as e:
         raise e
 
@@ -52,6 +92,36 @@ async def add_run_event(run_id: str, event_data: CreateRunEvent) -> SerializedRu
     except Exception as e:
         raise e
 
+@router.get("/{run_id}/events/{event_id}/screenshot")
+async def get_run_event_screenshot(run_id: str, event_id: str, request: Request) -> Response:
+    if not ObjectId.is_valid(event_id):
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    screenshot = await open_run_event_screenshot(run_id, event_id)
+    if not screenshot:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+
+    chunks, media_type, digest = screenshot
+    # Screenshots are content addressed, so they can be cached forever
+    headers = {"ETag": f'"{digest}"', "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+@router.post("/{run_id}/events:batch")
+async def add_run_events_batch(run_id: str, request: Request) -> BatchIngestResult:
+    if not ObjectId.is_valid(run_id):
+        raise HTTPException(status_code=400, detail=f"Invalid run id: {run_id}")
+    return await ingest_ndjson(request.stream(), CreateRunEvent, {"run_id": run_id}, create_run_events, BATCH_UPLOAD_CHUNK_SIZE)
+
+@router.get("/{run_id}/archive")
+async def get_run_archive(run_id: str, kind: Optional[str] = Query(None, regex="^(log|event)$")) -> StreamingResponse:
+    if not ObjectId.is_valid(run_id):
+        raise HTTPException(status_code=404, detail="Run not found")
+    lines = await read_run_archive(run_id, kind)
+    if lines is None:
+        raise HTTPException(status_code=404, detail="Run has not been archived")
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 class RunStatusUpdate(BaseModel):
     status: RunStatus
 
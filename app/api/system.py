@@ -0,0 +1,12 @@
+from fastapi import APIRouter, HTTPException
+
+from app.indexes import index_report
+
+router = APIRouter()
+
+@router.get("/indexes")
+async def get_index_report() -> dict[str, dict[str, list[str]]]:
+    try:
+        return await index_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building index report: {e}")
@@ -1,12 +1,17 @@
 from pymongo import AsyncMongoClient
 import os
 
+from app.utils.metrics import MongoCommandMetrics
+
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-client = AsyncMongoClient(MONGO_URI)
+client = AsyncMongoClient(MONGO_URI, event_listeners=[MongoCommandMetrics()])
 db = client['bot_orchestration']
 
 agents_collection = db['agents']
 bots_collection = db['bots']
+bot_versions_collection = db['bot_versions']
 runs_collection = db['runs']
 run_logs_collection = db['run_logs']
-run_events_collection = db['run_events']
\ No newline at end of file
+run_events_collection = db['run_events']
+leases_collection = db['leases']
+bot_stats_collection = db['bot_stats']
@@ -0,0 +1,87 @@
+from typing import Any
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.database import db
+
+# Indexes each collection should have, keyed by collection name. They are
+# created at startup and compared against the live indexes by index_report().
+INDEXES: dict[str, list[IndexModel]] = {
+    "agents": [
+        IndexModel([("agent_id", ASCENDING)], unique=True),
+        # Available-agent listings filter on status and heartbeat age
+        IndexModel([("status", ASCENDING), ("last_heartbeat", ASCENDING)]),
+    ],
+    "bots": [
+        # Only scheduled bots are of interest to the scheduler
+        IndexModel([("schedule", ASCENDING)], partialFilterExpression={"schedule": {"$type": "string"}}),
+        # The leader polls for bots changed through other replicas
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "bot_versions": [
+        IndexModel([("bot_id", ASCENDING), ("version", ASCENDING)], unique=True),
+        IndexModel([("bot_id", ASCENDING), ("script_hash", ASCENDING)]),
+        IndexModel([("bot_id", ASCENDING), ("_id", DESCENDING)]),
+    ],
+    "runs": [
+        # monitor_queued_runs, cleanup_stuck_runs and the queued-run claim
+        IndexModel([("status", ASCENDING), ("start_time", ASCENDING)]),
+        # One run per bot and cron fire time, however many schedulers try
+        IndexModel([("bot_id", ASCENDING), ("scheduled_time", ASCENDING)], unique=True,
+                   partialFilterExpression={"scheduled_time": {"$type": "date"}}),
+        # Paging through the runs of a bot or an agent, newest first
+        IndexModel([("bot_id", ASCENDING), ("_id", DESCENDING)]),
+        IndexModel([("agent_id", ASCENDING), ("_id", DESCENDING)]),
+        # Finished runs waiting to be archived
+        IndexModel([("archived_at", ASCENDING), ("end_time", ASCENDING)]),
+    ],
+    # Per-bot run statistics, one document per bot, granularity and bucket start
+    "bot_stats": [
+        IndexModel([("bot_id", ASCENDING), ("granularity", ASCENDING), ("start", ASCENDING)], unique=True),
+        IndexModel([("expire_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "run_logs": [
+        IndexModel([("run_id", ASCENDING), ("timestamp", ASCENDING)]),
+        IndexModel([("run_id", ASCENDING), ("_id", ASCENDING)]),
+        # Only set once the run is archived, so nothing expires before it is archived
+        IndexModel([("expire_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "run_events": [
+        IndexModel([("run_id", ASCENDING), ("timestamp", ASCENDING)]),
+        IndexModel([("run_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("expire_at", ASCENDING)], expireAfterSeconds=0),
+        # Blob garbage collection looks up which screenshots are still referenced
+        IndexModel([("screenshot_hash", ASCENDING)]),
+    ],
+}
+
+def index_key(keys: Any) -> tuple[tuple[str, Any], ...]:
+    return tuple((field, direction) for field, direction in keys)
+
+async def ensure_indexes() -> None:
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # Usually an existing index with the same keys but different options
+            print(f"[Indexes] Could not create indexes on {collection_name}: {e}")
+
+async def index_report() -> dict[str, dict[str, list[str]]]:
+    report: dict[str, dict[str, list[str]]] = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        existing_keys = {index_key(info["key"]): name for name, info in existing.items()}
+        declared_keys = {index_key(index.document["key"].items()): index.document["name"] for index in indexes}
+
+        # $indexStats counts accesses since the server (or the index) was last started
+        stats_cursor = await collection.aggregate([{"$indexStats": {}}])
+        usage = {stats["name"]: stats["accesses"]["ops"] async for stats in stats_cursor}
+
+        report[collection_name] = {
+            "missing": [name for key, name in declared_keys.items() if key not in existing_keys],
+            "undeclared": [name for key, name in existing_keys.items() if key not in declared_keys and name != "_id_"],
+            "unused": [name for name, ops in usage.items() if ops == 0 and name != "_id_"],
+        }
+    return report
@@ -3,12 +3,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from app.api import agents, bots, runs
+from app.api import agents, bots, metrics, runs, system
+from app.utils.http_client import close_agent_client, open_agent_client
+from app.utils.pagination import NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER
 from app.utils.socket_manager import sio_app
-from .services.agent_service import monitor_agents
-from .services.scheduler_service import schedule_bot_runs, monitor_queued_runs
-from .services.run_service import cleanup_stuck_runs
-from app.database import agents_collection, runs_collection, run_events_collection, run_logs_collection
+from .services.agent_service import drain_agent_writes, load_agent_registry, monitor_agents
+from .services.scheduler_service import monitor_queued_runs, start_schedule_loop, stop_schedule_loop
+from .services.archive_service import archive_finished_runs, delete_unreferenced_blobs
+from .services.dispatch_service import start_dispatch_loop, stop_dispatch_loop
+from .services.lease_service import leader_only, scheduler_lease
+from .services.run_log_service import run_log_buffer
+from .services.run_service import cleanup_stuck_runs, sync_run_queue
+from app.indexes import ensure_indexes
 
 # Create a FastAPI app
 app = FastAPI()
@@ -18,17 +24,33 @@ scheduler = AsyncIOScheduler()
 
 @app.on_event("startup")
 async def startup_event() -> None:
-    await agents_collection.create_index("agent_id", unique=True)
-    await runs_collection.create_index("bot_id", unique=False)
-    await run_events_collection.create_index("run_id", unique=False)
-    await run_logs_collection.create_index("run_id", unique=False)
+    await ensure_indexes()
+
+    await open_agent_client()
+    await load_agent_registry()
+    run_log_buffer.start()
+    scheduler_lease.start()
+    await sync_run_queue()
+    start_dispatch_loop()
+    start_schedule_loop()
 
     scheduler.add_job(monitor_agents, CronTrigger.from_crontab('* * * * *'))  # Every minute
-    scheduler.add_job(schedule_bot_runs, CronTrigger.from_crontab('* * * * *'))  # Every minute
-    scheduler.add_job(monitor_queued_runs, CronTrigger.from_crontab('* * * * *'))  # Every minute
-    scheduler.add_job(cleanup_stuck_runs, CronTrigger.from_crontab('* * * * *'))  # Every minute
+    scheduler.add_job(sync_run_queue, CronTrigger.from_crontab('* * * * *'))  # Every minute
+    scheduler.add_job(leader_only(monitor_queued_runs), CronTrigger.from_crontab('* * * * *'))  # Every minute
+    scheduler.add_job(leader_only(cleanup_stuck_runs), CronTrigger.from_crontab('* * * * *'))  # Every minute
+    scheduler.add_job(leader_only(archive_finished_runs), CronTrigger.from_crontab('*/10 * * * *'))  # Every 10 minutes
+    scheduler.add_job(leader_only(delete_unreferenced_blobs), CronTrigger.from_crontab('30 * * * *'))  # Every hour
     scheduler.start()
 
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    scheduler.shutdown(wait=False)
+    await stop_schedule_loop()
+    await stop_dispatch_loop()
+    await scheduler_lease.stop()
+    await run_log_buffer.stop()
+    await drain_agent_writes()
+    await close_agent_client()
 
 
 # Add CORS middleware to allow cross-origin requests
@@ -38,12 +60,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER],
 )
 
 # Include routers
 app.include_router(agents.router, prefix="/agents", tags=["agents"])
 app.include_router(bots.router, prefix="/bots", tags=["bots"])
 app.include_router(runs.router, prefix="/runs", tags=["runs"])
+app.include_router(system.router, prefix="/system", tags=["system"])
+app.include_router(metrics.router, tags=["metrics"])
 
 # Mount the Socket.IO app onto the FastAPI app at the "/socket.io" path
 app.mount("/socket.io", sio_app)
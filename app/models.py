@@ -1,3 +1,4 @@
+import re
 from datetime import datetime
 from enum import Enum
 from typing import Any, Optional
@@ -38,6 +39,17 @@ class RunStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+class RunPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+class OverlapPolicy(str, Enum):
+    # What happens when a bot's schedule fires while earlier runs have not finished
+    SKIP = "skip"
+    QUEUE = "queue"
+    REPLACE = "replace"
+
 class LogLevel(str, Enum):
     DEBUG = "DEBUG"
     INFO = "INFO"
@@ -45,6 +57,15 @@ class LogLevel(str, Enum):
     ERROR = "ERROR"
     CRITICAL = "CRITICAL"
 
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class StatsGranularity(str, Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
 class AgentStatus(str, Enum):
     AVAILABLE = "available"
     BUSY = "busy"
@@ -65,6 +86,11 @@ class RunBase(BaseModel):
     agent_id: Optional[str] = None
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
+    # Cron fire time of a scheduled run; unique per bot
+    scheduled_time: Optional[datetime] = None
+    # Version of the bot script the run was dispatched with
+    bot_version: Optional[int] = None
+    priority: RunPriority = RunPriority.NORMAL
 
 class CreateRun(RunBase):
     status: RunStatus = RunStatus.QUEUED
@@ -80,7 +106,7 @@ class RunStatusUpdate(BaseModel):
     status: RunStatus
 
 class SerializedRun(MongoModel, RunBase):
-    pass
+    archived_at: Optional[datetime] = None
 
 # RUN LOG MODELS
 
@@ -104,11 +130,33 @@ class RunEventBase(BaseModel):
     payload: Optional[dict[str, Any]] = None
     screenshot: Optional[str] = None
 
+# What base64.b64decode(validate=True) accepts, checked without decoding
+BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+
 class CreateRunEvent(RunEventBase):
-    pass
+    @validator('screenshot')
+    def validate_screenshot(cls, v: Any) -> Any:
+        # Accept plain base64 as produced by Selenium, or a base64 data URL
+        if v and v.startswith("data:"):
+            v = v.partition(",")[2]
+        # Only the format is checked; the image is decoded once, when it is stored
+        if v and (len(v) % 4 or not BASE64_PATTERN.fullmatch(v)):
+            raise ValueError("Screenshot must be base64 encoded")
+        return v
 
 class SerializedRunEvent(MongoModel, RunEventBase):
     timestamp: datetime
+    screenshot_hash: Optional[str] = None
+
+# BATCH INGEST MODELS
+
+class BatchRecordError(BaseModel):
+    index: int
+    error: str
+
+class BatchIngestResult(BaseModel):
+    accepted: int
+    errors: list[BatchRecordError]
 
 # AGENT MODELS
 
@@ -148,8 +196,29 @@ class AgentLogEvent(BaseModel):
 class BotBase(BaseModel):
     name: str
     script: str
+    # sha256 and version number of the script, set by the orchestrator
+    script_hash: Optional[str] = None
+    version: Optional[int] = None
+    # 5 field cron expression, or 6 fields with seconds last ("*/15 * * * * 0,30")
     schedule: Optional[str] = None
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    # Priority of the bot's scheduled runs, high unless set
+    priority: Optional[RunPriority] = None
+    # Runs of this bot in progress at once; unlimited unless set
+    max_concurrency: Optional[int] = Field(None, ge=1)
+    # skip: no new run while max_concurrency (or 1) runs are queued or in progress
+    # queue: always queue, the dispatcher holds runs back at max_concurrency
+    # replace: cancel the bot's runs still waiting in the queue and queue the new one
+    overlap_policy: OverlapPolicy = OverlapPolicy.QUEUE
+    # Only agents advertising all of these labels run the bot, e.g. ["browser=chrome", "region=eu"]
+    required_labels: list[str] = []
+    # Spread this bot's runs over a window of this many seconds after each fire time,
+    # overriding SCHEDULE_SPREAD_SECONDS; 0 turns spreading off
+    schedule_spread: Optional[float] = Field(None, ge=0)
+    # Override the global retention of this bot's run logs and events
+    log_retention_days: Optional[int] = Field(None, ge=1)
+    event_retention_days: Optional[int] = Field(None, ge=1)
 
     @validator('schedule')
     def validate_schedule(cls, v: Any) -> Any:
@@ -164,6 +233,13 @@ class UpdateBot(BaseModel):
     name: Optional[str] = None
     script: Optional[str] = None
     schedule: Optional[str] = None
+    schedule_spread: Optional[float] = Field(None, ge=0)
+    priority: Optional[RunPriority] = None
+    max_concurrency: Optional[int] = Field(None, ge=1)
+    overlap_policy: Optional[OverlapPolicy] = None
+    required_labels: Optional[list[str]] = None
+    log_retention_days: Optional[int] = Field(None, ge=1)
+    event_retention_days: Optional[int] = Field(None, ge=1)
 
     @validator('schedule')
     def validate_schedule(cls, v: Any) -> Any:
@@ -172,4 +248,38 @@ class UpdateBot(BaseModel):
         return v
 
 class SerializedBot(MongoModel, BotBase):
-    pass
\ No newline at end of file
+    pass
+
+class BotVersion(MongoModel):
+    bot_id: str
+    version: int
+    script_hash: str
+    # Stored as a full snapshot rather than a delta against the previous version
+    snapshot: bool
+    size: int
+    created_at: datetime
+
+# BOT STATS MODELS
+
+class RunStatsBucket(BaseModel):
+    start: datetime
+    runs: int = 0
+    completed: int = 0
+    errors: int = 0
+    success_ratio: Optional[float] = None
+    # Run durations in seconds; the quantiles are within 1% of the exact values
+    duration_mean: Optional[float] = None
+    duration_min: Optional[float] = None
+    duration_max: Optional[float] = None
+    duration_p50: Optional[float] = None
+    duration_p90: Optional[float] = None
+    duration_p95: Optional[float] = None
+    duration_p99: Optional[float] = None
+
+class BotStats(BaseModel):
+    bot_id: str
+    granularity: StatsGranularity
+    since: datetime
+    until: datetime
+    total: RunStatsBucket
+    buckets: list[RunStatsBucket]
\ No newline at end of file
@@ -0,0 +1,206 @@
+import heapq
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional
+
+from ..models import AgentStatus, SerializedAgent
+from ..utils.config import AGENT_DEFAULT_SLOTS, HEARTBEAT_INTERVAL
+
+
+# Agents advertise how many runs they accept at once as resources["slots"]
+def agent_slots(agent: SerializedAgent) -> int:
+    try:
+        return max(int(agent.resources.get("slots", AGENT_DEFAULT_SLOTS)), 0)
+    except (TypeError, ValueError):
+        return AGENT_DEFAULT_SLOTS
+
+# ...and their capabilities as resources["labels"], either a list of labels or
+# a mapping such as {"browser": "chrome", "region": "eu"}, read as "browser=chrome"
+# and "region=eu". Bots list the labels they need in required_labels.
+def agent_labels(agent: SerializedAgent) -> frozenset[str]:
+    labels = agent.resources.get("labels")
+    if isinstance(labels, dict):
+        return frozenset(f"{key}={value}" for key, value in labels.items())
+    if isinstance(labels, (list, tuple)):
+        return frozenset(str(label) for label in labels)
+    return frozenset()
+
+HeapItem = tuple[int, int, str, int]
+
+@dataclass
+class AgentEntry:
+    agent: SerializedAgent
+    active: int = 0
+    version: int = 0
+    in_heap: bool = False
+    labels: frozenset[str] = frozenset()
+
+    @property
+    def free(self) -> int:
+        return agent_slots(self.agent) - self.active
+
+    def is_candidate(self) -> bool:
+        return self.agent.status == AgentStatus.AVAILABLE and bool(self.agent.public_url) and self.free > 0
+
+    def is_fresh(self, cutoff: datetime) -> bool:
+        return self.agent.last_heartbeat is not None and self.agent.last_heartbeat > cutoff
+
+
+class AgentRegistry:
+    """In-process view of the agent fleet, kept current by heartbeats and status updates.
+
+    The least-loaded agent is picked from a lazily invalidated heap of free slots.
+    An inverted index keeps one such heap per label, along with the set of agents
+    with free slots carrying it. Runs that need labels are matched from the heap
+    of their rarest label, so only agents carrying it are ever looked at.
+    """
+
+    def __init__(self) -> None:
+        self._agents: dict[str, AgentEntry] = {}
+        self._heap: list[HeapItem] = []
+        self._label_heaps: dict[str, list[HeapItem]] = {}
+        self._label_free: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def _push(self, entry: AgentEntry) -> None:
+        entry.version += 1
+        entry.in_heap = entry.is_candidate()
+        agent_id = entry.agent.agent_id
+        if entry.in_heap:
+            item = (-entry.free, entry.active, agent_id, entry.version)
+            heapq.heappush(self._heap, item)
+            for label in entry.labels:
+                self._label_free.setdefault(label, set()).add(agent_id)
+                label_heap = self._label_heaps.setdefault(label, [])
+                heapq.heappush(label_heap, item)
+                if len(label_heap) > 2 * len(self._label_free[label]) + 64:
+                    self._label_heaps[label] = self._compact(label_heap)
+        else:
+            self._discard_labels(agent_id, entry.labels)
+        # Superseded entries are dropped lazily; rebuild once they dominate the heap
+        if len(self._heap) > 2 * len(self._agents) + 64:
+            self._heap = self._compact(self._heap)
+
+    def _drop(self, entry: AgentEntry) -> None:
+        # Invalidates the agent's items in every heap
+        entry.version += 1
+        entry.in_heap = False
+        self._discard_labels(entry.agent.agent_id, entry.labels)
+
+    def _discard_labels(self, agent_id: str, labels: Iterable[str]) -> None:
+        for label in labels:
+            free = self._label_free.get(label)
+            if free is not None:
+                free.discard(agent_id)
+                if not free:
+                    del self._label_free[label]
+                    self._label_heaps.pop(label, None)
+
+    def _compact(self, heap: list[HeapItem]) -> list[HeapItem]:
+        heap = [item for item in heap if self._is_current(item)]
+        heapq.heapify(heap)
+        return heap
+
+    def _is_current(self, item: HeapItem) -> bool:
+        entry = self._agents.get(item[2])
+        return entry is not None and entry.version == item[3]
+
+    def get(self, agent_id: str) -> Optional[SerializedAgent]:
+        entry = self._agents.get(agent_id)
+        return entry.agent if entry else None
+
+    def agents(self) -> list[SerializedAgent]:
+        return [entry.agent for entry in self._agents.values()]
+
+    def upsert(self, agent: SerializedAgent) -> None:
+        entry = self._agents.get(agent.agent_id)
+        if entry is None:
+            entry = self._agents[agent.agent_id] = AgentEntry(agent=agent, labels=agent_labels(agent))
+            self._push(entry)
+            return
+
+        previous = entry.agent
+        entry.agent = agent
+        labels = agent_labels(agent)
+        if labels != entry.labels:
+            self._drop(entry)
+            entry.labels = labels
+        if (previous.status != agent.status or previous.public_url != agent.public_url
+                or agent_slots(previous) != agent_slots(agent) or not entry.in_heap):
+            self._push(entry)
+
+    def update(self, agent_id: str, fields: dict[str, Any]) -> Optional[SerializedAgent]:
+        entry = self._agents.get(agent_id)
+        if entry is None:
+            return None
+        self.upsert(entry.agent.copy(update=fields))
+        return entry.agent
+
+    def suspend(self, agent_id: str) -> None:
+        # Take the agent out of rotation until its next heartbeat or status update
+        entry = self._agents.get(agent_id)
+        if entry:
+            self._drop(entry)
+
+    def has_free(self) -> bool:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return bool(self._heap)
+
+    def acquire(self, required_labels: frozenset[str] = frozenset()) -> Optional[SerializedAgent]:
+        if not required_labels:
+            heap = self._heap
+        else:
+            rarest = min(required_labels, key=lambda label: len(self._label_free.get(label, ())))
+            if rarest not in self._label_free:
+                return None
+            heap = self._label_heaps[rarest]
+
+        cutoff = datetime.now() - timedelta(seconds=HEARTBEAT_INTERVAL * 2)
+        unsuitable: list[HeapItem] = []
+        acquired: Optional[AgentEntry] = None
+        while heap:
+            item = heapq.heappop(heap)
+            entry = self._agents.get(item[2])
+            if entry is None or entry.version != item[3]:
+                continue
+            if not entry.is_fresh(cutoff):
+                self._drop(entry)
+                continue
+            if not required_labels <= entry.labels:
+                unsuitable.append(item)
+                continue
+            acquired = entry
+            break
+        for item in unsuitable:
+            heapq.heappush(heap, item)
+        if acquired is None:
+            return None
+        acquired.active += 1
+        self._push(acquired)
+        return acquired.agent
+
+    def release(self, agent_id: str) -> None:
+        entry = self._agents.get(agent_id)
+        if entry and entry.active > 0:
+            entry.active -= 1
+            self._push(entry)
+
+    def free_slots(self) -> int:
+        return sum(max(entry.free, 0) for entry in self._agents.values() if entry.is_candidate())
+
+    def reset(self, agents: list[SerializedAgent], active: dict[str, int]) -> None:
+        self._agents = {
+            agent.agent_id: AgentEntry(agent=agent, active=active.get(agent.agent_id, 0), labels=agent_labels(agent))
+            for agent in agents
+        }
+        self._heap = []
+        self._label_heaps = {}
+        self._label_free = {}
+        for entry in self._agents.values():
+            self._push(entry)
+
+
+agent_registry = AgentRegistry()
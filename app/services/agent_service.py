@@ -1,16 +1,26 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import Any, Optional
 
 from pydantic import BaseModel
-from fastapi.encoders import jsonable_encoder
+from pymongo import UpdateOne
 
-from ..models import AgentLogEvent, AgentStatus, CreateAgent, SerializedAgent, UpdateAgent
-from ..utils.socket_manager import sio
+from ..models import AgentLogEvent, AgentStatus, CreateAgent, RunStatus, SerializedAgent, UpdateAgent
+from ..utils.socket_manager import SUMMARY_ROOM, agent_room, emit_ui, sio
 from ..utils.config import HEARTBEAT_INTERVAL
-from ..database import agents_collection
+from ..utils.serialization import construct_model
+from ..utils.pagination import PageQuery, find_page, page_projection
+from ..database import agents_collection, runs_collection
+from .agent_registry import agent_registry
+from .dispatch_signal import notify_dispatch
+from .lease_service import scheduler_lease
 
-def serialize_agent(agent: dict[str, Any]) -> SerializedAgent:
-    return SerializedAgent(**agent)
+# Agent changes waiting to be written behind the registry, merged per agent
+pending_agent_writes: dict[str, dict[str, Any]] = {}
+agent_write_task: Optional["asyncio.Task[None]"] = None
+
+def serialize_agent(agent: dict[str, Any], partial: bool = False) -> SerializedAgent:
+    return construct_model(SerializedAgent, agent, partial)
 
 async def create_agent(agent_data: CreateAgent) -> Optional[SerializedAgent]:
     try:
@@ -27,6 +37,9 @@ async def create_agent(agent_data: CreateAgent) -> Optional[SerializedAgent]:
             raise Exception("Error registering agent")
 
         serialized_agent = serialize_agent(agent)
+        agent_registry.upsert(serialized_agent)
+        if serialized_agent.status == AgentStatus.AVAILABLE:
+            notify_dispatch()
         await emit_agent_update(serialized_agent)
         return serialized_agent
     except Exception as e:
@@ -42,6 +55,16 @@ async def get_agent_by_id(agent_id: str) -> Optional[SerializedAgent]:
 async def update_agent(agent_id: str, data: UpdateAgent) -> Optional[SerializedAgent]:
     try:
         payload = data.dict(exclude_unset=True)
+
+        # Known agents are updated in memory and persisted in the background
+        registered_agent = agent_registry.update(agent_id, payload)
+        if registered_agent:
+            persist_agent(agent_id, payload)
+            if payload.get("status") == AgentStatus.AVAILABLE:
+                notify_dispatch()
+            await emit_agent_update(registered_agent)
+            return registered_agent
+
         await agents_collection.update_one(
             {"agent_id": agent_id},
             {"$set": payload}
@@ -50,17 +73,20 @@ async def update_agent(agent_id: str, data: UpdateAgent) -> Optional[SerializedA
         if not agent:
             return None
         serialized_agent = serialize_agent(agent)
+        agent_registry.upsert(serialized_agent)
+        if serialized_agent.status == AgentStatus.AVAILABLE:
+            notify_dispatch()
         await emit_agent_update(serialized_agent)
         return serialized_agent
     except Exception as e:
         print(f"Error updating agent {agent_id}: {e}")
         return None
 
-async def list_agents() -> list[SerializedAgent]:
+async def list_agents(page: PageQuery = PageQuery(), status: Optional[AgentStatus] = None) -> list[SerializedAgent]:
     try:
-        agents_cursor = agents_collection.find()
-        agents = await agents_cursor.to_list(length=None)
-        return [serialize_agent(agent) for agent in agents]
+        query = {"status": status.value} if status else {}
+        agents = await find_page(agents_collection, query, page, projection=page_projection(SerializedAgent, page))
+        return [serialize_agent(agent, partial=bool(page.fields)) for agent in agents]
     except Exception as e:
         print(f"Error listing agents: {e}")
         return []
@@ -74,35 +100,65 @@ async def list_available_agents() -> list[SerializedAgent]:
         print(f"Error listing available agents: {e}")
         return []
 
-async def agent_heartbeat(agent_id: str, status: AgentStatus) -> Optional[SerializedAgent]:
+async def agent_heartbeat(agent_id: str, status: Optional[AgentStatus]) -> Optional[SerializedAgent]:
+    if status is None:
+        return await update_agent(agent_id, UpdateAgent(last_heartbeat=datetime.now()))
     return await update_agent(agent_id, UpdateAgent(last_heartbeat=datetime.now(), status=status))
 
 
 async def update_agent_status(agent_id: str, status: AgentStatus) -> Optional[SerializedAgent]:
     return await update_agent(agent_id, UpdateAgent(status=status.value))
 
-async def find_available_agent() -> Optional[SerializedAgent]:
-    try:
-        cutoff = datetime.now() - timedelta(seconds=HEARTBEAT_INTERVAL * 2)
-        agent = await agents_collection.find_one({
-            "last_heartbeat": {"$gt": cutoff},
-            "status": AgentStatus.AVAILABLE.value
-        })
-        if agent:
-            return serialize_agent(agent)
-        return None
-    except Exception as e:
-        print(f"Error finding available agent: {e}")
-        return None
+def persist_agent(agent_id: str, payload: dict[str, Any]) -> None:
+    global agent_write_task
+    pending_agent_writes.setdefault(agent_id, {}).update(payload)
+    if agent_write_task is None or agent_write_task.done():
+        agent_write_task = asyncio.create_task(flush_agent_writes())
+
+async def flush_agent_writes() -> None:
+    while pending_agent_writes:
+        writes = list(pending_agent_writes.items())
+        pending_agent_writes.clear()
+        try:
+            await agents_collection.bulk_write(
+                [UpdateOne({"agent_id": agent_id}, {"$set": payload}) for agent_id, payload in writes],
+                ordered=False
+            )
+        except Exception as e:
+            print(f"Error persisting agent updates: {e}")
+
+async def count_active_runs() -> dict[str, int]:
+    cursor = await runs_collection.aggregate([
+        {"$match": {"status": {"$in": [RunStatus.STARTING.value, RunStatus.RUNNING.value]}, "agent_id": {"$ne": None}}},
+        {"$group": {"_id": "$agent_id", "count": {"$sum": 1}}}
+    ])
+    return {doc["_id"]: doc["count"] async for doc in cursor}
+
+async def drain_agent_writes() -> None:
+    if agent_write_task is not None and not agent_write_task.done():
+        await agent_write_task
+    await flush_agent_writes()
+
+async def load_agent_registry() -> None:
+    # Rebuild the registry from Mongo so it also reflects changes made by other processes
+    await drain_agent_writes()
+    agents = await agents_collection.find().to_list(length=None)
+    active = await count_active_runs()
+    agent_registry.reset([serialize_agent(agent) for agent in agents], active)
+    print(f"[Monitor] Loaded {len(agent_registry)} agents, {agent_registry.free_slots()} free slots")
 
 async def monitor_agents() -> None:
     try:
         now = datetime.now()
         cutoff = now - timedelta(seconds=5 * HEARTBEAT_INTERVAL)
-        await agents_collection.update_many(
-            {"last_heartbeat": {"$lt": cutoff}},
-            {"$set": {"status": AgentStatus.OFFLINE.value}}
-        )
+        await drain_agent_writes()
+        if await scheduler_lease.confirm():
+            await agents_collection.update_many(
+                {"last_heartbeat": {"$lt": cutoff}},
+                {"$set": {"status": AgentStatus.OFFLINE.value}}
+            )
+        # Every replica dispatches, so each keeps its own registry current
+        await load_agent_registry()
         print(f"[Monitor] Checked agents at {now.isoformat()}")
     except Exception as e:
         print(f"Error monitoring agents: {e}")
@@ -147,13 +203,12 @@ async def handle_agent_status_update(sid: str, data: dict[str, Any]) -> None:
 # EVENT EMITTERS
 
 async def emit_agent_update(agent: SerializedAgent) -> None:
-    data = jsonable_encoder(agent)
-    await sio.emit('agent_updated', data, namespace='/ui')
+    await emit_ui('agent_updated', agent, [agent_room(agent.agent_id), SUMMARY_ROOM])
 
 async def emit_agent_log(agent_id: str, log_message: str) -> None:
-    data = jsonable_encoder({
+    data = {
         "agent_id": agent_id,
         "log": log_message,
         "timestamp": datetime.now()
-    })
-    await sio.emit('agent_log_created', data, namespace='/ui')
+    }
+    await emit_ui('agent_log_created', data, agent_room(agent_id))
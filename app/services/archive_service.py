@@ -0,0 +1,180 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterable, Optional
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.database import bots_collection, run_events_collection, run_logs_collection, runs_collection
+from app.models import RunStatus
+from app.utils.blob_store import delete_blob, list_blobs
+from app.utils.config import (ARCHIVE_AFTER_HOURS, ARCHIVE_BATCH_SIZE, ARCHIVE_PATH, ARCHIVE_TIME_BUDGET, BLOB_GC_BATCH_SIZE,
+                              BLOB_GC_GRACE_HOURS, EXPORT_BATCH_SIZE, RUN_EVENT_RETENTION_DAYS, RUN_LOG_RETENTION_DAYS)
+
+FINISHED_STATUSES = [RunStatus.COMPLETED.value, RunStatus.ERROR.value, RunStatus.CANCELLED.value]
+ARCHIVED_COLLECTIONS = {"log": run_logs_collection, "event": run_events_collection}
+
+# Each archived run is one gzip'd NDJSON file holding its logs and events,
+# one record per line tagged with "kind": "log" or "event"
+
+def archive_file(run_id: str, end_time: datetime) -> str:
+    return f"{end_time:%Y-%m}/{run_id}.ndjson.gz"
+
+def run_end_time(run: dict[str, Any]) -> datetime:
+    # Runs cancelled before end_time was set on cancellation only have a start time
+    end_time: datetime = run.get("end_time") or run["start_time"]
+    return end_time
+
+def expire_times(end_time: datetime, bot: Optional[dict[str, Any]]) -> dict[str, datetime]:
+    # Retention is per bot, falling back to the global one
+    bot = bot or {}
+    return {
+        "log": end_time + timedelta(days=bot.get("log_retention_days") or RUN_LOG_RETENTION_DAYS),
+        "event": end_time + timedelta(days=bot.get("event_retention_days") or RUN_EVENT_RETENTION_DAYS),
+    }
+
+async def find_retention_bots(runs: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    bot_ids = list({ObjectId(run["bot_id"]) for run in runs if ObjectId.is_valid(run["bot_id"])})
+    bots_cursor = bots_collection.find({"_id": {"$in": bot_ids}}, {"log_retention_days": 1, "event_retention_days": 1})
+    return {str(bot["_id"]): bot async for bot in bots_cursor}
+
+def write_lines(archive: gzip.GzipFile, lines: list[str]) -> None:
+    archive.write("".join(lines).encode())
+
+async def write_run_archive(run_id: str, path: Path) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique, so that a leader that lost its lease cannot write into the same file
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    records = 0
+    archive = await asyncio.to_thread(gzip.open, tmp_path, "wb")
+    try:
+        for kind, collection in ARCHIVED_COLLECTIONS.items():
+            lines: list[str] = []
+            async for doc in collection.find({"run_id": run_id}).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE):
+                doc.pop("expire_at", None)
+                lines.append(json.dumps({"kind": kind, **jsonable_encoder(doc, custom_encoder={ObjectId: str})}) + "\n")
+                if len(lines) >= EXPORT_BATCH_SIZE:
+                    await asyncio.to_thread(write_lines, archive, lines)
+                    records += len(lines)
+                    lines = []
+            if lines:
+                await asyncio.to_thread(write_lines, archive, lines)
+                records += len(lines)
+    finally:
+        await asyncio.to_thread(archive.close)
+    os.replace(tmp_path, path)
+    return records
+
+async def archive_run(run: dict[str, Any], bot: Optional[dict[str, Any]]) -> None:
+    run_id = str(run["_id"])
+    end_time = run_end_time(run)
+    relative_path = archive_file(run_id, end_time)
+    records = await write_run_archive(run_id, Path(ARCHIVE_PATH) / relative_path)
+
+    # The archive is safely on disk, so the documents may now expire once
+    # their retention period is over
+    expire_at = expire_times(end_time, bot)
+    for kind, collection in ARCHIVED_COLLECTIONS.items():
+        await collection.update_many({"run_id": run_id}, {"$set": {"expire_at": expire_at[kind]}})
+    await runs_collection.update_one({"_id": run["_id"]}, {"$set": {"archived_at": datetime.now(), "archive_file": relative_path}})
+    print(f"[Archive] Archived {records} records of run {run_id} to {relative_path}")
+
+async def archive_finished_runs() -> None:
+    # Works through the backlog batch by batch, so retention keeps up however
+    # many runs finish, but stops after ARCHIVE_TIME_BUDGET seconds
+    deadline = time.monotonic() + ARCHIVE_TIME_BUDGET
+    cutoff = datetime.now() - timedelta(hours=ARCHIVE_AFTER_HOURS)
+    query: dict[str, Any] = {
+        "archived_at": None, "status": {"$in": FINISHED_STATUSES},
+        "$or": [{"end_time": {"$lt": cutoff}}, {"end_time": None, "start_time": {"$lt": cutoff}}]
+    }
+    # Runs that failed to archive are left for the next pass rather than retried in this one
+    failed: list[ObjectId] = []
+    archived = 0
+    try:
+        while True:
+            if time.monotonic() >= deadline:
+                backlog = await runs_collection.count_documents({**query, "_id": {"$nin": failed}})
+                print(f"[Archive] Time budget used up after archiving {archived} runs, {backlog} runs still waiting")
+                return
+
+            runs = await runs_collection.find(
+                {**query, "_id": {"$nin": failed}},
+                {"_id": 1, "bot_id": 1, "start_time": 1, "end_time": 1}
+            ).sort("end_time", 1).limit(ARCHIVE_BATCH_SIZE).to_list(length=ARCHIVE_BATCH_SIZE)
+            if not runs:
+                return
+
+            bots = await find_retention_bots(runs)
+            for run in runs:
+                try:
+                    await archive_run(run, bots.get(run["bot_id"]))
+                    archived += 1
+                except Exception as e:
+                    failed.append(run["_id"])
+                    print(f"[Archive] Error archiving run {run['_id']}: {e}")
+    except Exception as e:
+        print(f"[Archive] Unexpected error while archiving runs: {e}")
+
+async def set_archived_run_expiry(docs: list[dict[str, Any]], kind: str) -> None:
+    # Logs and events that arrive after their run was archived expire along
+    # with the ones archived, instead of being kept forever
+    run_ids = [ObjectId(run_id) for run_id in {doc["run_id"] for doc in docs} if ObjectId.is_valid(run_id)]
+    if not run_ids:
+        return
+    runs = await runs_collection.find(
+        {"_id": {"$in": run_ids}, "archived_at": {"$ne": None}},
+        {"bot_id": 1, "start_time": 1, "end_time": 1}
+    ).to_list(length=None)
+    if not runs:
+        return
+    bots = await find_retention_bots(runs)
+    expire_at = {str(run["_id"]): expire_times(run_end_time(run), bots.get(run["bot_id"]))[kind] for run in runs}
+    for doc in docs:
+        if doc["run_id"] in expire_at:
+            doc["expire_at"] = expire_at[doc["run_id"]]
+
+async def referenced_blobs(digests: Iterable[str]) -> set[str]:
+    cursor = run_events_collection.find({"screenshot_hash": {"$in": list(digests)}}, {"screenshot_hash": 1})
+    return {event["screenshot_hash"] async for event in cursor}
+
+async def delete_unreferenced_blobs() -> None:
+    # Screenshots are shared between events by content, so a blob is only
+    # deleted once no run event refers to it any more
+    cutoff = (datetime.now() - timedelta(hours=BLOB_GC_GRACE_HOURS)).timestamp()
+    try:
+        candidates = await asyncio.to_thread(list_blobs, cutoff)
+        deleted = 0
+        for i in range(0, len(candidates), BLOB_GC_BATCH_SIZE):
+            batch = candidates[i:i + BLOB_GC_BATCH_SIZE]
+            referenced = await referenced_blobs(batch)
+            for digest in batch:
+                if digest not in referenced and await asyncio.to_thread(delete_blob, digest, cutoff):
+                    deleted += 1
+        if deleted:
+            print(f"[Archive] Deleted {deleted} unreferenced blobs")
+    except Exception as e:
+        print(f"[Archive] Unexpected error while deleting unreferenced blobs: {e}")
+
+def read_archive_lines(path: Path, kind: Optional[str]) -> list[str]:
+    with gzip.open(path, "rt") as archive:
+        return [line for line in archive if kind is None or json.loads(line).get("kind") == kind]
+
+async def read_run_archive(run_id: str, kind: Optional[str] = None) -> Optional[AsyncIterator[str]]:
+    run = await runs_collection.find_one({"_id": ObjectId(run_id)}, {"archive_file": 1})
+    if not run or not run.get("archive_file"):
+        return None
+    path = Path(ARCHIVE_PATH) / run["archive_file"]
+    if not path.is_file():
+        return None
+
+    async def lines() -> AsyncIterator[str]:
+        for line in await asyncio.to_thread(read_archive_lines, path, kind):
+            yield line
+    return lines()
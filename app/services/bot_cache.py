@@ -0,0 +1,44 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from ..utils.config import BOT_CACHE_TTL
+
+
+@dataclass
+class BotMeta:
+    script_hash: str
+    version: int
+    max_concurrency: Optional[int] = None
+    required_labels: frozenset[str] = frozenset()
+
+
+class BotCache:
+    """Dispatch-time bot metadata, so starting a run does not read the bot document.
+
+    Entries are dropped when the bot is changed through this process and expire
+    after BOT_CACHE_TTL seconds to pick up changes made through other replicas.
+    """
+
+    def __init__(self, ttl: float = BOT_CACHE_TTL) -> None:
+        self._ttl = ttl
+        self._entries: dict[str, tuple[BotMeta, float]] = {}
+
+    def get(self, bot_id: str) -> Optional[BotMeta]:
+        cached = self._entries.get(bot_id)
+        if cached is None:
+            return None
+        meta, expires = cached
+        if expires < time.monotonic():
+            del self._entries[bot_id]
+            return None
+        return meta
+
+    def put(self, bot_id: str, meta: BotMeta) -> None:
+        self._entries[bot_id] = (meta, time.monotonic() + self._ttl)
+
+    def invalidate(self, bot_id: str) -> None:
+        self._entries.pop(bot_id, None)
+
+
+bot_cache = BotCache()
@@ -0,0 +1,28 @@
+class BotConcurrency:
+    """Runs in progress (STARTING or RUNNING) per bot, as seen by this process.
+
+    Kept current by the run status transitions and rebuilt from Mongo every
+    minute, which also picks up runs dispatched by other replicas.
+    """
+
+    def __init__(self) -> None:
+        self._active: dict[str, int] = {}
+
+    def count(self, bot_id: str) -> int:
+        return self._active.get(bot_id, 0)
+
+    def start(self, bot_id: str) -> None:
+        self._active[bot_id] = self._active.get(bot_id, 0) + 1
+
+    def finish(self, bot_id: str) -> None:
+        active = self._active.get(bot_id, 0)
+        if active > 1:
+            self._active[bot_id] = active - 1
+        else:
+            self._active.pop(bot_id, None)
+
+    def reset(self, active: dict[str, int]) -> None:
+        self._active = dict(active)
+
+
+bot_concurrency = BotConcurrency()
@@ -1,30 +1,59 @@
+from datetime import datetime
 from typing import Any, Optional
 from fastapi import HTTPException
-from fastapi.encoders import jsonable_encoder
 import httpx
 
 from bson.objectid import ObjectId
 from pymongo.errors import PyMongoError
 
-from app.models import CreateBot, SerializedBot, SerializedRun, UpdateBot, UpdateRun
-from app.services.agent_service import find_available_agent
-from app.services.run_service import serialize_run, update_run
-from app.database import bots_collection, runs_collection
-from app.utils.socket_manager import sio
-
-def serialize_bot(bot: dict[str, Any]) -> SerializedBot:
-    return SerializedBot(**bot)
+from app.models import CreateBot, SerializedAgent, SerializedBot, UpdateBot
+from app.services.bot_cache import BotMeta, bot_cache
+from app.services.bot_version_service import save_head_version, save_script_version, script_hash
+from app.services.run_service import resume_bot_runs
+from app.services.schedule_queue import schedule_offset, schedule_queue
+from app.database import bots_collection
+from app.utils.config import ORCHESTRATOR_URL
+from app.utils.http_client import post_to_agent
+from app.utils.pagination import PageQuery, find_page, page_projection
+from app.utils.serialization import construct_model
+from app.utils.socket_manager import SUMMARY_ROOM, bot_room, emit_ui, sio
+
+def serialize_bot(bot: dict[str, Any], partial: bool = False) -> SerializedBot:
+    return construct_model(SerializedBot, bot, partial)
+
+async def get_bot_meta(bot_id: str) -> Optional[BotMeta]:
+    meta = bot_cache.get(bot_id)
+    if meta is not None:
+        return meta
+    bot = await bots_collection.find_one({"_id": ObjectId(bot_id)}, {"script_hash": 1, "version": 1, "script": 1, "max_concurrency": 1, "required_labels": 1})
+    if not bot:
+        return None
+    if not bot.get("script_hash") or not bot.get("version"):
+        # Bots created before scripts were hashed and versioned
+        bot["version"] = await save_head_version(bot)
+        bot["script_hash"] = script_hash(bot.get("script", ""))
+        await bots_collection.update_one({"_id": bot["_id"]}, {"$set": {"script_hash": bot["script_hash"]}})
+    meta = BotMeta(script_hash=bot["script_hash"], version=bot["version"], max_concurrency=bot.get("max_concurrency"),
+                   required_labels=frozenset(bot.get("required_labels") or ()))
+    bot_cache.put(bot_id, meta)
+    return meta
 
 async def create_bot(data: CreateBot) -> Optional[SerializedBot]:
     try:
         payload = data.dict()
+        payload["updated_at"] = datetime.now()
+        payload["script_hash"] = script_hash(data.script)
+        payload["version"] = 1
         result = await bots_collection.insert_one(payload)
+        await save_script_version(str(result.inserted_id), 1, data.script)
         bot = await bots_collection.find_one({"_id": result.inserted_id})
 
         if not bot:
             raise Exception("Error creating bot")
 
         serialized_bot = serialize_bot(bot)
+        schedule_queue.upsert(serialized_bot.id, serialized_bot.schedule, datetime.now(),
+                              schedule_offset(serialized_bot.id, serialized_bot.schedule_spread))
         await emit_bot_created(serialized_bot)
         return serialized_bot
     except Exception as e:
@@ -37,23 +66,50 @@ async def get_bot_by_id(bot_id: str) -> SerializedBot:
         raise HTTPException(status_code=404, detail="Bot not found")
     return serialize_bot(bot)
 
-async def list_bots() -> list[SerializedBot]:
-    bots_cursor = bots_collection.find()
-    bots = await bots_cursor.to_list(length=None)
-    return [serialize_bot(bot) for bot in bots]
+async def list_bots(page: PageQuery = PageQuery()) -> list[SerializedBot]:
+    bots = await find_page(bots_collection, {}, page, projection=page_projection(SerializedBot, page))
+    return [serialize_bot(bot, partial=bool(page.fields)) for bot in bots]
 
 async def update_bot(bot_id: str, bot_data: UpdateBot) -> Optional[SerializedBot]:
     try:
         payload = bot_data.dict(exclude_unset=True)
-        await bots_collection.update_one({"_id": ObjectId(bot_id)}, {"$set": payload})
+        payload["updated_at"] = datetime.now()
+        query: dict[str, Any] = {"_id": ObjectId(bot_id)}
+        current = None
+        if bot_data.script is not None:
+            current = await bots_collection.find_one(query, {"script": 1, "version": 1})
+            if not current:
+                raise HTTPException(status_code=404, detail="Bot not found")
+            if current.get("script") == bot_data.script:
+                current = None
+            else:
+                # A new script is a new version; the version filter makes
+                # concurrent edits of the same bot fail instead of overwriting each other
+                previous_version = await save_head_version(current)
+                query["version"] = previous_version
+                payload["version"] = previous_version + 1
+                payload["script_hash"] = script_hash(bot_data.script)
+
+        result = await bots_collection.update_one(query, {"$set": payload})
+        bot_cache.invalidate(bot_id)
+        if "max_concurrency" in payload:
+            resume_bot_runs(bot_id)
+        if current is not None:
+            if not result.matched_count:
+                raise HTTPException(status_code=409, detail="Bot was modified concurrently, retry the update")
+            await save_script_version(bot_id, payload["version"], payload["script"], current.get("script", ""))
         bot = await bots_collection.find_one({"_id": ObjectId(bot_id)})
 
         if not bot:
             raise HTTPException(status_code=404, detail="Bot not found")
 
         serialized_bot = serialize_bot(bot)
+        schedule_queue.upsert(serialized_bot.id, serialized_bot.schedule, datetime.now(),
+                              schedule_offset(serialized_bot.id, serialized_bot.schedule_spread))
         await emit_bot_updated(serialized_bot)
         return serialized_bot
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error updating bot: {e}")
         return None
@@ -62,6 +118,8 @@ async def delete_bot(bot_id: str) -> bool:
     try:
         result = await bots_collection.delete_one({"_id": ObjectId(bot_id)})
         if result.deleted_count > 0:
+            schedule_queue.remove(bot_id)
+            bot_cache.invalidate(bot_id)
             await emit_bot_deleted(bot_id)
             return True
         else:
@@ -71,62 +129,40 @@ async def delete_bot(bot_id: str) -> bool:
         print(f"Error deleting bot {bot_id}: {e}")
         return False
 
-async def start_bot_run(bot_id: str, run_id: str) -> bool:
-    bot = await bots_collection.find_one({"_id": ObjectId(bot_id)})
-    if not bot:
-        print(f"Bot {bot_id} not found")
-        return False
-
-    bot_script = bot.get("script")
-
-    # find an available agent
-    agent = await find_available_agent()
-    if not agent:
-        print(f"No available agent to run bot {bot_id}")
-        return False
-
+async def start_bot_run(bot_id: str, run_id: str, agent: SerializedAgent, meta: BotMeta) -> bool:
+    # The dispatcher has already resolved the bot, so False always means the agent failed
     agent_public_url = agent.public_url
     if not agent_public_url:
         return False
 
     agent_id = agent.agent_id
 
+    # The agent fetches the script from script_url unless it has this hash cached
     payload = {
         "bot_id": bot_id,
-        "bot_script": bot_script,
-        "run_id": run_id
+        "run_id": run_id,
+        "script_hash": meta.script_hash,
+        "script_url": f"{ORCHESTRATOR_URL}/bots/{bot_id}/scripts/{meta.script_hash}"
     }
 
-    # Assign the run to the agent (it may not take it right away)
-    await update_run(run_id, UpdateRun(agent_id=agent_id))
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(f"{agent_public_url}/run", json=payload)
-            response.raise_for_status()
-            return True
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error {e.response.status_code} while starting bot on agent {agent_id}: {e.response.text}")
-            return False
-        except httpx.RequestError as e:
-            print(f"Failed to start bot on agent {agent_id}: {e}")
-            return False
-
-async def get_bot_runs(bot_id: str) -> list[SerializedRun]:
-    runs_cursor = runs_collection.find({"bot_id": bot_id})
-    runs = await runs_cursor.to_list(length=None)
-    return [serialize_run(run) for run in runs]
+    try:
+        await post_to_agent(agent_id, f"{agent_public_url}/run", payload)
+        return True
+    except httpx.HTTPStatusError as e:
+        print(f"HTTP error {e.response.status_code} while starting bot on agent {agent_id}: {e.response.text}")
+        return False
+    except httpx.RequestError as e:
+        print(f"Failed to start bot on agent {agent_id}: {e}")
+        return False
 
 # EVENT EMITTERS
 
 async def emit_bot_created(bot: SerializedBot) -> None:
-    data = jsonable_encoder(bot)
-    await sio.emit('bot_created', data, namespace='/ui')
+    await emit_ui('bot_created', bot, [bot_room(bot.id), SUMMARY_ROOM])
 
 async def emit_bot_deleted(bot_id: str) -> None:
-    await sio.emit('bot_deleted', {"bot_id": bot_id}, namespace='/ui')
+    await emit_ui('bot_deleted', {"bot_id": bot_id}, [bot_room(bot_id), SUMMARY_ROOM])
 
 async def emit_bot_updated(bot: SerializedBot) -> None:
-    data = jsonable_encoder(bot)
-    await sio.emit('bot_updated', data, namespace='/ui')
+    await emit_ui('bot_updated', bot, [bot_room(bot.id), SUMMARY_ROOM])
 
@@ -0,0 +1,119 @@
+import difflib
+import hashlib
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Optional
+
+from bson import ObjectId
+
+from app.database import bot_versions_collection, bots_collection
+from app.models import BotVersion
+from app.utils.config import BOT_VERSION_SNAPSHOT_INTERVAL
+from app.utils.pagination import PageQuery, find_page
+from app.utils.serialization import construct_model
+
+# Every script edit creates an immutable version. Versions are stored as zlib
+# compressed line deltas against the previous version, with a full snapshot
+# every BOT_VERSION_SNAPSHOT_INTERVAL versions to bound reconstruction. The bot
+# document keeps the head script and version, so the latest one is a single read.
+
+def script_hash(script: str) -> str:
+    return hashlib.sha256(script.encode()).hexdigest()
+
+def encode_delta(previous: str, script: str) -> bytes:
+    # ["=", i, j] copies lines i:j of the previous version, ["+", lines] inserts new ones
+    old_lines = previous.splitlines(keepends=True)
+    new_lines = script.splitlines(keepends=True)
+    ops: list[list[Any]] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i1, i2])
+        elif j2 > j1:
+            ops.append(["+", new_lines[j1:j2]])
+    return zlib.compress(json.dumps(ops).encode())
+
+def apply_delta(previous: str, delta: bytes) -> str:
+    old_lines = previous.splitlines(keepends=True)
+    lines: list[str] = []
+    for op in json.loads(zlib.decompress(delta)):
+        if op[0] == "=":
+            lines.extend(old_lines[op[1]:op[2]])
+        else:
+            lines.extend(op[1])
+    return "".join(lines)
+
+def serialize_bot_version(version: dict[str, Any]) -> BotVersion:
+    return construct_model(BotVersion, version)
+
+async def save_script_version(bot_id: str, version: int, script: str, previous: Optional[str] = None) -> None:
+    snapshot = zlib.compress(script.encode())
+    data, is_snapshot = snapshot, True
+    if previous is not None and version % BOT_VERSION_SNAPSHOT_INTERVAL != 1:
+        delta = encode_delta(previous, script)
+        if len(delta) < len(snapshot):
+            data, is_snapshot = delta, False
+
+    # $setOnInsert keeps versions immutable when the same version is saved twice
+    await bot_versions_collection.update_one(
+        {"bot_id": bot_id, "version": version},
+        {"$setOnInsert": {
+            "script_hash": script_hash(script),
+            "snapshot": is_snapshot,
+            "size": len(script),
+            "data": data,
+            "created_at": datetime.now()
+        }},
+        upsert=True
+    )
+
+async def save_head_version(bot: dict[str, Any]) -> int:
+    # Store the bot's current script as a version if it is not stored yet: bots
+    # created before versioning, or edits interrupted before their version was saved
+    version: int = bot.get("version") or 1
+    if not bot.get("version"):
+        await bots_collection.update_one({"_id": bot["_id"], "version": None}, {"$set": {"version": version}})
+    await save_script_version(str(bot["_id"]), version, bot.get("script", ""))
+    return version
+
+async def get_bot_version_script(bot_id: str, version: int) -> Optional[str]:
+    snapshot = await bot_versions_collection.find_one(
+        {"bot_id": bot_id, "version": {"$lte": version}, "snapshot": True},
+        {"version": 1, "data": 1},
+        sort=[("version", -1)]
+    )
+    if not snapshot:
+        return None
+    script = zlib.decompress(snapshot["data"]).decode()
+    expected = snapshot["version"]
+    cursor = bot_versions_collection.find(
+        {"bot_id": bot_id, "version": {"$gt": snapshot["version"], "$lte": version}},
+        {"version": 1, "snapshot": 1, "data": 1}
+    ).sort("version", 1)
+    async for delta in cursor:
+        expected += 1
+        if delta["version"] != expected:
+            print(f"[Versions] Version {expected} of bot {bot_id} is missing")
+            return None
+        script = zlib.decompress(delta["data"]).decode() if delta["snapshot"] else apply_delta(script, delta["data"])
+    return script if expected == version else None
+
+async def get_script_by_hash(bot_id: str, digest: str) -> Optional[str]:
+    if not ObjectId.is_valid(bot_id):
+        return None
+    # Almost every request is for the head script, which the bot document holds
+    head = await bots_collection.find_one({"_id": ObjectId(bot_id), "script_hash": digest}, {"script": 1})
+    if head:
+        return str(head.get("script", ""))
+    # Versions outlive their bot, but are only served while it exists
+    if not await bots_collection.find_one({"_id": ObjectId(bot_id)}, {"_id": 1}):
+        return None
+    version = await bot_versions_collection.find_one({"bot_id": bot_id, "script_hash": digest}, {"version": 1},
+                                                     sort=[("version", -1)])
+    if not version:
+        return None
+    return await get_bot_version_script(bot_id, version["version"])
+
+async def list_bot_versions(bot_id: str, page: PageQuery = PageQuery()) -> list[BotVersion]:
+    versions = await find_page(bot_versions_collection, {"bot_id": bot_id}, page, descending=True, projection={"data": 0})
+    return [serialize_bot_version(version) for version in versions]
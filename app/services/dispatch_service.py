@@ -0,0 +1,161 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.database import runs_collection
+from app.models import RunStatus, SerializedAgent
+from app.services.agent_registry import agent_registry
+from app.services.bot_cache import BotMeta
+from app.services.bot_concurrency import bot_concurrency
+from app.services.bot_service import get_bot_meta, start_bot_run
+from app.services.dispatch_signal import dispatch_event, notify_dispatch
+from app.services.run_queue import run_queue
+from app.services.run_service import emit_run_updated, enqueue_runs, finish_bot_run, serialize_run, update_run_status
+from app.utils.config import DISPATCH_CONCURRENCY
+from app.utils.metrics import DISPATCH_FAILURES, DISPATCH_QUEUE_WAIT_SECONDS, DISPATCH_SECONDS, DISPATCHED_RUNS
+
+dispatch_task: Optional["asyncio.Task[None]"] = None
+
+async def claim_queued_run() -> Optional[tuple[dict[str, Any], SerializedAgent, BotMeta]]:
+    # The run queue decides which run goes next and the agent registry picks a
+    # free agent with the labels the bot requires. Moving the run to STARTING is
+    # atomic so that no other dispatcher (or orchestrator replica) can pick it up
+    # as well. Runs that were cancelled or dispatched elsewhere are skipped, and
+    # runs of deleted bots fail here, before any agent is involved.
+    while agent_registry.has_free():
+        queued = run_queue.pop()
+        if queued is None:
+            return None
+        agent: Optional[SerializedAgent] = None
+        started = False
+        try:
+            meta = await get_bot_meta(queued.bot_id)
+            if not meta:
+                print(f"[Dispatch] Bot {queued.bot_id} not found for run {queued.run_id}")
+                await update_run_status(queued.run_id, RunStatus.ERROR, from_statuses=[RunStatus.QUEUED])
+                continue
+            if not meta.max_concurrency or bot_concurrency.count(queued.bot_id) < meta.max_concurrency:
+                agent = agent_registry.acquire(meta.required_labels)
+            if agent is None:
+                # Held back until one of the bot's runs finishes or a matching agent frees up
+                run_queue.park(queued.bot_id)
+                run_queue.push(queued.run_id, queued.bot_id, queued.priority, queued.start_time)
+                continue
+
+            bot_concurrency.start(queued.bot_id)
+            started = True
+            run: Optional[dict[str, Any]] = await runs_collection.find_one_and_update(
+                {"_id": ObjectId(queued.run_id), "status": RunStatus.QUEUED.value},
+                {"$set": {"status": RunStatus.STARTING.value, "agent_id": agent.agent_id, "bot_version": meta.version}},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            # Hand back the agent slot, the bot's count and the run, so the
+            # next pass can try again; the other workers carry on meanwhile
+            print(f"[Dispatch] Unexpected error while claiming run {queued.run_id}: {e}")
+            if agent is not None:
+                agent_registry.release(agent.agent_id)
+            if started:
+                finish_bot_run(queued.bot_id)
+            run_queue.push(queued.run_id, queued.bot_id, queued.priority, queued.start_time)
+            return None
+        if run:
+            return run, agent, meta
+        agent_registry.release(agent.agent_id)
+        finish_bot_run(queued.bot_id)
+    return None
+
+async def release_run(run_id: str, agent_id: str) -> None:
+    # Put a claimed run back in the queue, unless something else already moved it on
+    run = await runs_collection.find_one_and_update(
+        {"_id": ObjectId(run_id), "status": RunStatus.STARTING.value, "agent_id": agent_id},
+        {"$set": {"status": RunStatus.QUEUED.value, "agent_id": None}},
+        return_document=ReturnDocument.AFTER
+    )
+    if run:
+        agent_registry.release(agent_id)
+        finish_bot_run(run["bot_id"])
+        serialized_run = serialize_run(run)
+        await emit_run_updated(serialized_run)
+        enqueue_runs([serialized_run])
+
+async def dispatch_claimed_run(run: dict[str, Any], agent: SerializedAgent, meta: BotMeta) -> bool:
+    serialized_run = serialize_run(run)
+    if serialized_run.start_time:
+        DISPATCH_QUEUE_WAIT_SECONDS.observe(max((datetime.now() - serialized_run.start_time).total_seconds(), 0))
+    await emit_run_updated(serialized_run)
+
+    with DISPATCH_SECONDS.labels(agent.agent_id).time():
+        success = await start_bot_run(serialized_run.bot_id, serialized_run.id, agent, meta)
+    if not success:
+        DISPATCH_FAILURES.labels(agent.agent_id).inc()
+        await release_run(serialized_run.id, agent.agent_id)
+        return False
+    DISPATCHED_RUNS.labels(agent.agent_id).inc()
+    return True
+
+async def dispatch_queued_runs() -> int:
+    free_slots = agent_registry.free_slots()
+    if not free_slots:
+        return 0
+
+    # Bots parked for want of a matching agent get another chance every pass;
+    # those still at their concurrency limit are parked again when reached
+    run_queue.unpark_all()
+    dispatched = 0
+
+    async def worker() -> None:
+        nonlocal dispatched
+        while True:
+            claimed = await claim_queued_run()
+            if claimed is None:
+                return
+
+            run, agent, meta = claimed
+            try:
+                if await dispatch_claimed_run(run, agent, meta):
+                    dispatched += 1
+                    continue
+            except Exception as e:
+                print(f"[Dispatch] Unexpected error while dispatching run {run['_id']}: {e}")
+                DISPATCH_FAILURES.labels(agent.agent_id).inc()
+                await release_run(str(run["_id"]), agent.agent_id)
+            # Keep the agent out of rotation until it reports back
+            agent_registry.suspend(agent.agent_id)
+
+    workers = min(DISPATCH_CONCURRENCY, free_slots)
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    if dispatched:
+        print(f"[Dispatch] Dispatched {dispatched} runs, {agent_registry.free_slots()} agent slots left")
+    return dispatched
+
+async def run_dispatch_loop() -> None:
+    requested = dispatch_event()
+    while True:
+        await requested.wait()
+        # Cleared before the pass, so anything queued meanwhile triggers another one
+        requested.clear()
+        try:
+            await dispatch_queued_runs()
+        except Exception as e:
+            print(f"[Dispatch] Unexpected error while dispatching queued runs: {e}")
+
+def start_dispatch_loop() -> None:
+    global dispatch_task
+    if dispatch_task is None or dispatch_task.done():
+        dispatch_task = asyncio.create_task(run_dispatch_loop())
+    # Pick up whatever was queued while the orchestrator was down
+    notify_dispatch()
+
+async def stop_dispatch_loop() -> None:
+    global dispatch_task
+    if dispatch_task is not None:
+        dispatch_task.cancel()
+        try:
+            await dispatch_task
+        except asyncio.CancelledError:
+            pass
+        dispatch_task = None
@@ -0,0 +1,15 @@
+import asyncio
+from typing import Optional
+
+# Set whenever a run is queued or agent capacity frees up. The dispatch loop
+# folds any number of notifications into a single dispatch pass.
+dispatch_requested: Optional[asyncio.Event] = None
+
+def dispatch_event() -> asyncio.Event:
+    global dispatch_requested
+    if dispatch_requested is None:
+        dispatch_requested = asyncio.Event()
+    return dispatch_requested
+
+def notify_dispatch() -> None:
+    dispatch_event().set()
@@ -0,0 +1,141 @@
+import asyncio
+import functools
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.database import leases_collection
+from app.utils.config import LEADER_LEASE_RENEW_INTERVAL, LEADER_LEASE_TTL
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderLease:
+    """Mongo-backed lease that lets a single orchestrator replica act as leader.
+
+    The lease document holds the current holder, its expiry and a token that is
+    incremented on every change of holder. Expiry is compared against the server
+    clock ($$NOW), so replicas with skewed clocks still agree on it.
+
+    The token tells a leader whether it kept the lease since it last loaded its
+    state, but it is not checked atomically with the writes the lease guards. A
+    paused or partitioned leader can act for a moment after losing the lease, so
+    every job run under it must be idempotent and safe to run twice at once.
+    """
+
+    def __init__(self, name: str, ttl: float) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.token: Optional[int] = None
+        self.valid_until = 0.0
+        self.task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # Measured from before the last renewal was sent, so it lapses here first
+        return self.token is not None and time.monotonic() < self.valid_until
+
+    async def refresh(self) -> bool:
+        sent_at = time.monotonic()
+        try:
+            # Renew our own lease or take over an expired one. If another replica
+            # holds a live lease the filter misses, and the upsert hits a duplicate _id.
+            lease = await leases_collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": INSTANCE_ID}, {"$expr": {"$lt": ["$expires_at", "$$NOW"]}}]},
+                [{"$set": {
+                    "token": {"$cond": [
+                        {"$eq": ["$holder", INSTANCE_ID]}, "$token", {"$add": [{"$ifNull": ["$token", 0]}, 1]}
+                    ]},
+                    "holder": INSTANCE_ID,
+                    "expires_at": {"$add": ["$$NOW", int(self.ttl * 1000)]},
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            lease = None
+        except PyMongoError as e:
+            # Keep leading until the lease would have expired anyway
+            print(f"[Lease] Error refreshing lease {self.name}: {e}")
+            return self.is_leader
+
+        if lease is None:
+            if self.token is not None:
+                print(f"[Lease] {INSTANCE_ID} lost lease {self.name}")
+            self.token = None
+            return False
+        if lease["token"] != self.token:
+            print(f"[Lease] {INSTANCE_ID} acquired lease {self.name} with token {lease['token']}")
+        self.token = lease["token"]
+        self.valid_until = sent_at + self.ttl
+        return True
+
+    async def confirm(self) -> bool:
+        # Checks the lease document itself, which catches a lease lost while
+        # this replica was paused before the local deadline notices
+        if not self.is_leader:
+            return False
+        try:
+            lease = await leases_collection.find_one({
+                "_id": self.name, "holder": INSTANCE_ID, "token": self.token,
+                "$expr": {"$gt": ["$expires_at", "$$NOW"]}
+            }, {"_id": 1})
+        except PyMongoError as e:
+            print(f"[Lease] Error confirming lease {self.name}: {e}")
+            return False
+        return lease is not None
+
+    async def release(self) -> None:
+        if self.token is None:
+            return
+        self.token = None
+        try:
+            # Expire it now so that another replica takes over on its next attempt
+            await leases_collection.update_one(
+                {"_id": self.name, "holder": INSTANCE_ID},
+                [{"$set": {"expires_at": "$$NOW"}}]
+            )
+        except PyMongoError as e:
+            print(f"[Lease] Error releasing lease {self.name}: {e}")
+
+    async def run(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(LEADER_LEASE_RENEW_INTERVAL)
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.release()
+
+
+scheduler_lease = LeaderLease("scheduler", LEADER_LEASE_TTL)
+
+def leader_only(job: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[None]]:
+    """Wraps a periodic job so it is skipped on every replica but the leader.
+
+    This keeps replicas from duplicating work, but cannot fence a leader that
+    loses the lease while the job runs, so wrapped jobs must be idempotent:
+    their writes are conditional on the state they read (queuing scheduled
+    runs, failing stuck runs, archiving unarchived runs) or converge on the
+    same result (marking agents offline, deleting unreferenced blobs).
+    """
+    @functools.wraps(job)
+    async def run() -> None:
+        if await scheduler_lease.confirm():
+            await job()
+    return run
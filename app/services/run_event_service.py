@@ -1,40 +1,113 @@
+import asyncio
+import hashlib
+from base64 import b64decode
 from datetime import datetime
-from typing import Any
+from typing import Any, AsyncIterator, Optional
 
-from fastapi.encoders import jsonable_encoder
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
 
 from app.database import run_events_collection
 from app.models import CreateRunEvent, SerializedRunEvent
-from app.utils.socket_manager import sio
+from app.services.archive_service import set_archived_run_expiry
+from app.utils.blob_store import blob_exists, iter_blob, put_blob, sniff_media_type
+from app.utils.pagination import PageQuery, find_page, page_projection, time_range
+from app.utils.metrics import RUN_EVENTS_INGESTED
+from app.utils.serialization import construct_model
+from app.utils.socket_manager import emit_ui, run_room, sio
 
-def serialize_run_event(run_event: dict[str, Any]) -> SerializedRunEvent:
-    return SerializedRunEvent(**run_event)
+def serialize_run_event(run_event: dict[str, Any], partial: bool = False) -> SerializedRunEvent:
+    return construct_model(SerializedRunEvent, run_event, partial)
+
+async def prepare_run_event(data: CreateRunEvent) -> dict[str, Any]:
+    payload = data.dict()
+    payload["_id"] = ObjectId()
+    payload["timestamp"] = datetime.now()
+
+    # Screenshots go to the blob store; the event only keeps their hash
+    screenshot = payload.pop("screenshot", None)
+    payload["screenshot"] = None
+    payload["screenshot_hash"] = await put_blob(b64decode(screenshot)) if screenshot else None
+    return payload
 
 async def create_run_event(data: CreateRunEvent) -> SerializedRunEvent:
     try:
-        payload = data.dict()
-        payload["timestamp"] = datetime.now()
-        result = await run_events_collection.insert_one(payload)
-        event = await run_events_collection.find_one({"_id": result.inserted_id})
-        if not event:
-            raise Exception("Error creating run event")
-
-        serialized_run_event = serialize_run_event(event)
+        payload = await prepare_run_event(data)
+        await set_archived_run_expiry([payload], "event")
+        await run_events_collection.insert_one(payload)
+        RUN_EVENTS_INGESTED.inc()
+
+        serialized_run_event = serialize_run_event(payload)
         await emit_run_event(serialized_run_event)
         return serialized_run_event
     except Exception as e:
         # Handle exception
         raise e
 
-async def list_run_events(run_id: str) -> list[SerializedRunEvent]:
+async def create_run_events(data: list[CreateRunEvent]) -> None:
+    payloads = [await prepare_run_event(event_data) for event_data in data]
+    await set_archived_run_expiry(payloads, "event")
+
     try:
-        events_cursor = run_events_collection.find({"run_id": run_id})
-        events = await events_cursor.to_list(length=None)
-        return [serialize_run_event(event) for event in events]
+        await run_events_collection.insert_many(payloads, ordered=False)
+    except BulkWriteError as e:
+        failed = {write_error["index"] for write_error in e.details.get("writeErrors", [])}
+        RUN_EVENTS_INGESTED.inc(len(payloads) - len(failed))
+        await emit_run_events([serialize_run_event(payload) for i, payload in enumerate(payloads) if i not in failed])
+        raise
+    RUN_EVENTS_INGESTED.inc(len(payloads))
+    await emit_run_events([serialize_run_event(payload) for payload in payloads])
+
+async def list_run_events(run_id: str, page: PageQuery = PageQuery(), event_type: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None) -> list[SerializedRunEvent]:
+    try:
+        query: dict[str, Any] = {"run_id": run_id}
+        if event_type:
+            query["event_type"] = event_type
+        time_range(query, "timestamp", since, until)
+        # Older events may still carry the screenshot inline; leave it to the screenshot endpoint
+        projection = page_projection(SerializedRunEvent, page, excluded=["screenshot"])
+        events = await find_page(run_events_collection, query, page, projection=projection)
+        return [serialize_run_event(event, partial=bool(page.fields)) for event in events]
     except Exception as e:
         print(f"Error listing run events: {e}")
         raise e
 
+async def open_run_event_screenshot(run_id: str, event_id: str) -> Optional[tuple[AsyncIterator[bytes], str, str]]:
+    event = await run_events_collection.find_one(
+        {"_id": ObjectId(event_id), "run_id": run_id},
+        {"screenshot": 1, "screenshot_hash": 1}
+    )
+    if not event:
+        return None
+
+    digest = event.get("screenshot_hash")
+    if not digest and event.get("screenshot"):
+        # Events stored before the blob store existed keep the image inline
+        data = b64decode(event["screenshot"])
+        digest = hashlib.sha256(data).hexdigest()
+        chunks: AsyncIterator[bytes] = iter_bytes(data)
+    elif digest and await asyncio.to_thread(blob_exists, digest):
+        chunks = iter_blob(digest)
+    else:
+        return None
+
+    # Peek at the first chunk to tell the client which image format it gets
+    try:
+        head = await chunks.__anext__()
+    except StopAsyncIteration:
+        head = b""
+    media_type = sniff_media_type(head) or "application/octet-stream"
+    return prepend_chunk(head, chunks), media_type, digest
+
+async def iter_bytes(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+async def prepend_chunk(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield head
+    async for chunk in chunks:
+        yield chunk
+
 # EVENT HANDLERS
 
 @sio.on("run_event", namespace='/agent')
@@ -48,5 +121,13 @@ async def handle_run_event(sid: str, data: dict[str, Any]) -> None:
 # EVENT EMITTER
 
 async def emit_run_event(run_event: SerializedRunEvent) -> None:
-    data = jsonable_encoder(run_event)
-    await sio.emit("run_event", data, namespace='/ui')
\ No newline at end of file
+    await emit_ui("run_event", run_event, run_room(run_event.run_id))
+
+async def emit_run_events(run_events: list[SerializedRunEvent]) -> None:
+    by_run: dict[str, list[SerializedRunEvent]] = {}
+    for run_event in run_events:
+        by_run.setdefault(run_event.run_id, []).append(run_event)
+
+    for run_id, events in by_run.items():
+        data = {"run_id": run_id, "events": events}
+        await emit_ui("run_events", data, run_room(run_id))
@@ -1,36 +1,70 @@
 from datetime import datetime
-from typing import Any
+from typing import Any, Optional
 
-from fastapi.encoders import jsonable_encoder
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
 
 from app.database import run_logs_collection
-from app.models import CreateRunLog, SerializedRunLog
-from app.utils.socket_manager import sio
+from app.models import CreateRunLog, LogLevel, SerializedRunLog
+from app.services.archive_service import set_archived_run_expiry
+from app.utils.batch_buffer import BatchBuffer
+from app.utils.config import RUN_LOG_BATCH_SIZE, RUN_LOG_BUFFER_LIMIT, RUN_LOG_FLUSH_INTERVAL
+from app.utils.pagination import PageQuery, find_page, page_projection, time_range
+from app.utils.metrics import RUN_LOGS_INGESTED
+from app.utils.serialization import construct_model
+from app.utils.socket_manager import emit_ui, run_room, sio
 
-def serialize_run_log(run_log: dict[str, Any]) -> SerializedRunLog:
-    return SerializedRunLog(**run_log)
+def serialize_run_log(run_log: dict[str, Any], partial: bool = False) -> SerializedRunLog:
+    return construct_model(SerializedRunLog, run_log, partial)
+
+async def write_run_logs(logs: list[dict[str, Any]]) -> None:
+    await set_archived_run_expiry(logs, "log")
+    try:
+        await run_logs_collection.insert_many(logs, ordered=False)
+    except BulkWriteError as e:
+        # Still announce the logs that made it in before reporting the failures
+        failed = {write_error["index"] for write_error in e.details.get("writeErrors", [])}
+        RUN_LOGS_INGESTED.inc(len(logs) - len(failed))
+        await emit_run_logs([serialize_run_log(log) for i, log in enumerate(logs) if i not in failed])
+        raise
+    RUN_LOGS_INGESTED.inc(len(logs))
+    await emit_run_logs([serialize_run_log(log) for log in logs])
+
+run_log_buffer: BatchBuffer[dict[str, Any]] = BatchBuffer(
+    "RunLogs", write_run_logs, RUN_LOG_BATCH_SIZE, RUN_LOG_FLUSH_INTERVAL, RUN_LOG_BUFFER_LIMIT
+)
+
+def prepare_run_log(data: CreateRunLog) -> dict[str, Any]:
+    # The id and timestamp are assigned here so the log can be returned
+    # without waiting for the insert or reading it back
+    payload = data.dict()
+    payload["_id"] = ObjectId()
+    payload["timestamp"] = datetime.now()
+    return payload
 
 async def create_run_log(data: CreateRunLog) -> SerializedRunLog:
     try:
-        payload = data.dict()
-        payload["timestamp"] = datetime.now()
-        result = await run_logs_collection.insert_one(payload)
-        log = await run_logs_collection.find_one({"_id": result.inserted_id})
-        if not log:
-            raise Exception("Error creating run log")
-
-        serialized_run_log = serialize_run_log(log)
-        await emit_run_log(serialized_run_log)
+        payload = prepare_run_log(data)
+        serialized_run_log = serialize_run_log(payload)
+        await run_log_buffer.put(payload)
         return serialized_run_log
     except Exception as e:
         # Handle exception
         raise e
 
-async def list_run_logs(run_id: str) -> list[SerializedRunLog]:
+async def create_run_logs(data: list[CreateRunLog]) -> None:
+    # Bulk uploads are already batched, so they skip the buffer
+    await write_run_logs([prepare_run_log(log) for log in data])
+
+async def list_run_logs(run_id: str, page: PageQuery = PageQuery(), level: Optional[LogLevel] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None) -> list[SerializedRunLog]:
     try:
-        logs_cursor = run_logs_collection.find({"run_id": run_id})
-        logs = await logs_cursor.to_list(length=None)
-        return [serialize_run_log(log) for log in logs]
+        query: dict[str, Any] = {"run_id": run_id}
+        if level:
+            query["level"] = level.value
+        time_range(query, "timestamp", since, until)
+        logs = await find_page(run_logs_collection, query, page, projection=page_projection(SerializedRunLog, page))
+        return [serialize_run_log(log, partial=bool(page.fields)) for log in logs]
     except Exception as e:
         print(f"Error listing run logs: {e}")
         raise e
@@ -47,6 +81,12 @@ async def handle_run_log_event(sid: str, data: dict[str, Any]) -> None:
 
 # EVENT EMITTERS
 
-async def emit_run_log(run_log: SerializedRunLog) -> None:
-    data = jsonable_encoder(run_log)
-    await sio.emit("run_log", data, namespace='/ui')
\ No newline at end of file
+async def emit_run_logs(run_logs: list[SerializedRunLog]) -> None:
+    # One message per run room instead of one per log line
+    by_run: dict[str, list[SerializedRunLog]] = {}
+    for run_log in run_logs:
+        by_run.setdefault(run_log.run_id, []).append(run_log)
+
+    for run_id, logs in by_run.items():
+        data = {"run_id": run_id, "logs": logs}
+        await emit_ui("run_logs", data, run_room(run_id))
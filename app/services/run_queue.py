@@ -0,0 +1,143 @@
+import heapq
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from ..models import RunPriority
+from ..utils.config import RUN_PRIORITY_WEIGHTS
+
+
+@dataclass
+class QueuedRun:
+    run_id: str
+    bot_id: str
+    priority: RunPriority
+    start_time: datetime
+
+
+@dataclass
+class Flow:
+    # Queued runs of one bot within one priority class, oldest first
+    runs: list[tuple[datetime, str]] = field(default_factory=list)
+    pass_value: float = 0.0
+
+
+@dataclass
+class PriorityClass:
+    weight: float
+    flows: dict[str, Flow] = field(default_factory=dict)
+    heap: list[tuple[float, int, str]] = field(default_factory=list)
+    # Bots whose flows are held out of the heap until they are unparked
+    parked: set[str] = field(default_factory=set)
+    pass_value: float = 0.0
+    virtual_time: float = 0.0
+
+
+class RunQueue:
+    """Weighted fair queue of the QUEUED runs, using stride scheduling at two levels.
+
+    Priority classes share dispatches in proportion to their weights, and
+    within a class every bot with queued runs gets its turn in round robin.
+    A bot that queues hundreds of runs only delays the others of its class by
+    one run per round, and never delays higher classes by more than their
+    weights allow. Each class and bot holds a pass value; the smallest pass is
+    served next and advances by 1/weight, so push and pop are O(log n).
+
+    Bots at their concurrency limit are parked: their runs stay queued but are
+    passed over, at no cost to anyone else, until unpark() is called.
+    """
+
+    def __init__(self, weights: Optional[dict[str, float]] = None) -> None:
+        weights = weights or RUN_PRIORITY_WEIGHTS
+        self._classes = {priority: PriorityClass(weights[priority]) for priority in RunPriority}
+        self._heap: list[tuple[float, int, RunPriority]] = []
+        self._queued: set[str] = set()
+        self._parked: set[str] = set()
+        self._virtual_time = 0.0
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def __contains__(self, run_id: str) -> bool:
+        return run_id in self._queued
+
+    def _next_seq(self) -> int:
+        # Breaks pass value ties in arrival order
+        self._seq += 1
+        return self._seq
+
+    def push(self, run_id: str, bot_id: str, priority: RunPriority, start_time: datetime) -> None:
+        if run_id in self._queued:
+            return
+        self._queued.add(run_id)
+        priority_class = self._classes[priority]
+        flow = priority_class.flows.get(bot_id)
+        if flow is None:
+            flow = priority_class.flows[bot_id] = Flow()
+        heapq.heappush(flow.runs, (start_time, run_id))
+        if len(flow.runs) == 1:
+            self._activate(priority, bot_id, flow)
+
+    def _activate(self, priority: RunPriority, bot_id: str, flow: Flow) -> None:
+        # An idle bot or class rejoins at the current virtual time, so time
+        # spent idle cannot be saved up and spent as a burst later
+        priority_class = self._classes[priority]
+        flow.pass_value = max(flow.pass_value, priority_class.virtual_time)
+        heapq.heappush(priority_class.heap, (flow.pass_value, self._next_seq(), bot_id))
+        if len(priority_class.heap) > 1:
+            return
+        priority_class.pass_value = max(priority_class.pass_value, self._virtual_time)
+        heapq.heappush(self._heap, (priority_class.pass_value, self._next_seq(), priority))
+
+    def park(self, bot_id: str) -> None:
+        self._parked.add(bot_id)
+
+    def unpark(self, bot_id: str) -> bool:
+        if bot_id not in self._parked:
+            return False
+        self._parked.discard(bot_id)
+        for priority, priority_class in self._classes.items():
+            if bot_id in priority_class.parked:
+                priority_class.parked.discard(bot_id)
+                self._activate(priority, bot_id, priority_class.flows[bot_id])
+        return True
+
+    def unpark_all(self) -> None:
+        for bot_id in list(self._parked):
+            self.unpark(bot_id)
+
+    def pop(self) -> Optional[QueuedRun]:
+        while self._heap:
+            class_pass, _, priority = heapq.heappop(self._heap)
+            priority_class = self._classes[priority]
+            self._virtual_time = class_pass
+
+            flow_pass, _, bot_id = heapq.heappop(priority_class.heap)
+            if bot_id not in self._parked:
+                return self._pop_flow(priority, flow_pass, bot_id)
+            # Parked bots lose their place without being charged for it
+            priority_class.parked.add(bot_id)
+            if priority_class.heap:
+                heapq.heappush(self._heap, (class_pass, self._next_seq(), priority))
+        return None
+
+    def _pop_flow(self, priority: RunPriority, flow_pass: float, bot_id: str) -> QueuedRun:
+        priority_class = self._classes[priority]
+        priority_class.virtual_time = flow_pass
+        flow = priority_class.flows[bot_id]
+        start_time, run_id = heapq.heappop(flow.runs)
+        self._queued.discard(run_id)
+
+        if flow.runs:
+            flow.pass_value += 1
+            heapq.heappush(priority_class.heap, (flow.pass_value, self._next_seq(), bot_id))
+        else:
+            del priority_class.flows[bot_id]
+        if priority_class.heap:
+            priority_class.pass_value += 1 / priority_class.weight
+            heapq.heappush(self._heap, (priority_class.pass_value, self._next_seq(), priority))
+        return QueuedRun(run_id, bot_id, priority, start_time)
+
+
+run_queue = RunQueue()
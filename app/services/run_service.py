@@ -1,19 +1,92 @@
+import csv
+import io
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, AsyncIterator, Optional
 
 from bson import ObjectId
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 
+from app.services.agent_registry import agent_registry
+from app.services.bot_concurrency import bot_concurrency
+from app.services.dispatch_signal import notify_dispatch
 from app.services.run_event_service import create_run_event
+from app.services.run_queue import run_queue
+from app.services.stats_service import record_run_stats
 
 from ..database import runs_collection
-from ..models import (CreateRun, CreateRunEvent, RunStatus, RunStatusUpdate, SerializedRun, UpdateRun)
-from ..utils.socket_manager import sio
+from ..models import (CreateRun, CreateRunEvent, ExportFormat, RunPriority, RunStatus, RunStatusUpdate, SerializedRun, UpdateRun)
+from ..utils.config import EXPORT_BATCH_SIZE
+from ..utils.metrics import RUNS_BY_STATUS
+from ..utils.serialization import construct_model, dumps
+from ..utils.pagination import PageQuery, find_page, page_projection, time_range
+from ..utils.socket_manager import emit_ui, run_rooms, sio
 
+ACTIVE_STATUSES = [RunStatus.STARTING, RunStatus.RUNNING]
+UNFINISHED_STATUSES = [RunStatus.SCHEDULED, RunStatus.QUEUED, RunStatus.STARTING, RunStatus.RUNNING]
 
-def serialize_run(run: dict[str, Any]) -> SerializedRun:
-    return SerializedRun(**run)
+
+def serialize_run(run: dict[str, Any], partial: bool = False) -> SerializedRun:
+    return construct_model(SerializedRun, run, partial)
+
+def enqueue_runs(runs: list[SerializedRun]) -> None:
+    # Hand QUEUED runs to the dispatcher
+    queued = [run for run in runs if run.status == RunStatus.QUEUED]
+    for run in queued:
+        run_queue.push(run.id, run.bot_id, run.priority, run.start_time or datetime.now())
+    if queued:
+        notify_dispatch()
+
+def resume_bot_runs(bot_id: str) -> None:
+    # Let the dispatcher reconsider runs held back by the bot's concurrency limit
+    if run_queue.unpark(bot_id):
+        notify_dispatch()
+
+def finish_bot_run(bot_id: str) -> None:
+    bot_concurrency.finish(bot_id)
+    resume_bot_runs(bot_id)
+
+async def count_unfinished_runs(bot_ids: list[str]) -> dict[str, int]:
+    cursor = await runs_collection.aggregate([
+        {"$match": {"bot_id": {"$in": bot_ids}, "status": {"$in": [RunStatus.QUEUED.value, *[status.value for status in ACTIVE_STATUSES]]}}},
+        {"$group": {"_id": "$bot_id", "count": {"$sum": 1}}}
+    ])
+    return {doc["_id"]: doc["count"] async for doc in cursor}
+
+async def cancel_queued_runs(bot_ids: list[str]) -> int:
+    # Queued runs have not reached an agent, so cancelling them frees no agent slot.
+    # Each is cancelled on its own so that runs claimed meanwhile are left alone.
+    queued = runs_collection.find({"bot_id": {"$in": bot_ids}, "status": RunStatus.QUEUED.value}, {"_id": 1})
+    cancelled = 0
+    async for queued_run in queued:
+        run = await runs_collection.find_one_and_update(
+            {"_id": queued_run["_id"], "status": RunStatus.QUEUED.value},
+            {"$set": {"status": RunStatus.CANCELLED.value, "end_time": datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if run:
+            cancelled += 1
+            await emit_run_updated(serialize_run(run))
+    return cancelled
+
+async def sync_run_queue() -> None:
+    # Picks up runs queued by other replicas or before this one started, and
+    # the runs in progress per bot; runs that were dispatched meanwhile are
+    # skipped when claimed
+    try:
+        active = await runs_collection.aggregate([
+            {"$match": {"status": {"$in": [status.value for status in ACTIVE_STATUSES]}}},
+            {"$group": {"_id": "$bot_id", "count": {"$sum": 1}}}
+        ])
+        bot_concurrency.reset({doc["_id"]: doc["count"] async for doc in active})
+        run_queue.unpark_all()
+
+        queued = runs_collection.find({"status": RunStatus.QUEUED.value}, {"bot_id": 1, "status": 1, "priority": 1, "start_time": 1})
+        enqueue_runs([serialize_run(run) async for run in queued])
+    except Exception as e:
+        print(f"Error syncing the run queue: {e}")
 
 async def create_run(data: CreateRun) -> SerializedRun:
     try:
@@ -26,11 +99,30 @@ async def create_run(data: CreateRun) -> SerializedRun:
 
         serialized_run = serialize_run(run)
         await emit_run_created(serialized_run)
+        enqueue_runs([serialized_run])
         return serialized_run
     except Exception as e:
         # Handle exception
         raise e
 
+async def create_scheduled_runs(data: list[CreateRun]) -> list[SerializedRun]:
+    payloads = [{**run.dict(), "_id": ObjectId()} for run in data]
+    failed: set[int] = set()
+    try:
+        await runs_collection.insert_many(payloads, ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get("writeErrors", []):
+            failed.add(write_error["index"])
+            # Duplicate keys are runs another tick or process already created
+            if write_error.get("code") != 11000:
+                print(f"Error creating scheduled run: {write_error.get('errmsg')}")
+
+    serialized_runs = [serialize_run(payload) for i, payload in enumerate(payloads) if i not in failed]
+    for serialized_run in serialized_runs:
+        await emit_run_created(serialized_run)
+    enqueue_runs(serialized_runs)
+    return serialized_runs
+
 async def get_run_by_id(run_id: str) -> SerializedRun:
     try:
         run = await runs_collection.find_one({"_id": ObjectId(run_id)})
@@ -52,28 +144,65 @@ async def update_run(run_id: str, data: UpdateRun) -> SerializedRun:
 
         serialized_run = serialize_run(run)
         await emit_run_updated(serialized_run)
+        if payload.get("status") == RunStatus.QUEUED:
+            enqueue_runs([serialized_run])
         return serialized_run
     except Exception as e:
         # Handle exception
         raise e
 
-async def list_runs() -> list[SerializedRun]:
-    runs_cursor = runs_collection.find()
-    runs = await runs_cursor.to_list(length=None)
-    return [serialize_run(run) for run in runs]
+async def list_runs(page: PageQuery = PageQuery(), status: Optional[RunStatus] = None, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None, **filters: str) -> list[SerializedRun]:
+    # Newest runs first; the time range applies to start_time
+    query: dict[str, Any] = dict(filters)
+    if status:
+        query["status"] = status.value
+    time_range(query, "start_time", since, until)
+    runs = await find_page(runs_collection, query, page, descending=True, projection=page_projection(SerializedRun, page))
+    return [serialize_run(run, partial=bool(page.fields)) for run in runs]
 
-async def list_runs_by_agent(agent_id: str) -> list[SerializedRun]:
-    runs_cursor = runs_collection.find({"agent_id": agent_id})
-    runs = await runs_cursor.to_list(length=None)
-    return [serialize_run(run) for run in runs]
+async def list_runs_by_agent(agent_id: str, page: PageQuery = PageQuery(), status: Optional[RunStatus] = None,
+                             since: Optional[datetime] = None, until: Optional[datetime] = None) -> list[SerializedRun]:
+    return await list_runs(page, status, since, until, agent_id=agent_id)
 
-async def list_runs_by_bot(bot_id: str) -> list[SerializedRun]:
-    runs_cursor = runs_collection.find({"bot_id": bot_id})
-    runs = await runs_cursor.to_list(length=None)
-    return [serialize_run(run) for run in runs]
+async def list_runs_by_bot(bot_id: str, page: PageQuery = PageQuery(), status: Optional[RunStatus] = None,
+                           since: Optional[datetime] = None, until: Optional[datetime] = None) -> list[SerializedRun]:
+    return await list_runs(page, status, since, until, bot_id=bot_id)
+
+async def export_runs(export_format: ExportFormat, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      bot_id: Optional[str] = None, status: Optional[RunStatus] = None) -> AsyncIterator[str]:
+    # Streams runs straight off the cursor so memory use does not depend on the export size
+    query: dict[str, Any] = {"bot_id": bot_id} if bot_id else {}
+    if status:
+        query["status"] = status.value
+    time_range(query, "start_time", since, until)
+
+    columns = ["_id", *(field.alias for field in SerializedRun.__fields__.values() if field.alias != "_id")]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    if export_format == ExportFormat.CSV:
+        writer.writeheader()
+
+    rows = 0
+    async for run in runs_collection.find(query).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE):
+        serialized_run = serialize_run(run)
+        if export_format == ExportFormat.CSV:
+            writer.writerow(jsonable_encoder(serialized_run))
+        else:
+            buffer.write(dumps(serialized_run))
+            buffer.write("\n")
 
-async def queue_run(bot_id: str) -> SerializedRun:
-    run = await create_run(CreateRun(bot_id=bot_id, status="queued"))
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+async def queue_run(bot_id: str, priority: RunPriority = RunPriority.NORMAL) -> SerializedRun:
+    run = await create_run(CreateRun(bot_id=bot_id, status=RunStatus.QUEUED, priority=priority))
 
     return run
 
@@ -86,13 +215,34 @@ async def schedule_run(bot_id: str, start_time: datetime) -> SerializedRun:
 
     return run
 
-async def update_run_status(run_id: str, status: RunStatus) -> SerializedRun:
+async def update_run_status(run_id: str, status: RunStatus,
+                            from_statuses: Optional[list[RunStatus]] = None) -> SerializedRun:
+    # With from_statuses, runs in any other status are returned unchanged
     try:
-        run = await runs_collection.find_one({"_id": ObjectId(run_id)})
-        if not run:
-            raise HTTPException(status_code=404, detail="Run not found")
-
         update_data = UpdateRun(status=status)
+        finished = status in [RunStatus.COMPLETED, RunStatus.ERROR]
+        if status == RunStatus.RUNNING:
+            update_data.start_time = datetime.now()
+        elif finished or status == RunStatus.CANCELLED:
+            update_data.end_time = datetime.now()
+        payload = update_data.dict(exclude_unset=True)
+
+        # The transition only applies to the status it was decided on, so when
+        # two callers report the same run at once exactly one of them sees the
+        # previous status and hands back the slots and records the stats
+        while True:
+            current = await runs_collection.find_one({"_id": ObjectId(run_id)})
+            if not current:
+                raise HTTPException(status_code=404, detail="Run not found")
+            if from_statuses is not None and current.get("status") not in from_statuses:
+                return serialize_run(current)
+            run: Optional[dict[str, Any]] = await runs_collection.find_one_and_update(
+                {"_id": current["_id"], "status": current.get("status")},
+                {"$set": payload},
+                return_document=ReturnDocument.BEFORE
+            )
+            if run:
+                break
 
         if status == RunStatus.RUNNING:
             await create_run_event(CreateRunEvent(
@@ -100,11 +250,26 @@ async def update_run_status(run_id: str, status: RunStatus) -> SerializedRun:
                 event_type="info",
                 message="Run has started"
             ))
-            update_data.start_time = datetime.now()
-        elif status in [RunStatus.COMPLETED, RunStatus.ERROR]:
-            update_data.end_time = datetime.now()
 
-        return await update_run(run_id, update_data)
+        # Hand the agent and bot slots back once the run leaves the active states
+        if run.get("status") in ACTIVE_STATUSES and status in [RunStatus.COMPLETED, RunStatus.ERROR, RunStatus.CANCELLED]:
+            finish_bot_run(run["bot_id"])
+            if run.get("agent_id"):
+                agent_registry.release(run["agent_id"])
+                notify_dispatch()
+
+        serialized_run = serialize_run({**run, **payload})
+        await emit_run_updated(serialized_run)
+        if status == RunStatus.QUEUED:
+            enqueue_runs([serialized_run])
+
+        # Repeated status updates must not count the same run twice
+        if finished and update_data.end_time and run.get("status") not in [RunStatus.COMPLETED, RunStatus.ERROR]:
+            try:
+                await record_run_stats(run["bot_id"], status, run.get("start_time"), update_data.end_time)
+            except Exception as e:
+                print(f"Error recording stats of run {run_id}: {e}")
+        return serialized_run
     except Exception as e:
         raise e
 
@@ -119,12 +284,24 @@ async def cleanup_stuck_runs() -> None:
         stuck_runs = await stuck_runs_cursor.to_list(length=None)
         print(f"Found {len(stuck_runs)} stuck runs")
         for run in stuck_runs:
-            await update_run_status(str(run["_id"]), RunStatus.ERROR)
+            # Leaves runs alone that finished since they were read
+            await update_run_status(str(run["_id"]), RunStatus.ERROR, from_statuses=ACTIVE_STATUSES)
     except Exception as e:
         print(f"Error cleaning up stuck runs: {e}")
 
 # EVENT HANDLERS
 
+async def update_run_metrics() -> None:
+    counts = {status.value: 0 for status in UNFINISHED_STATUSES}
+    cursor = await runs_collection.aggregate([
+        {"$match": {"status": {"$in": list(counts)}}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ])
+    async for group in cursor:
+        counts[group["_id"]] = group["count"]
+    for status, count in counts.items():
+        RUNS_BY_STATUS.labels(status).set(count)
+
 @sio.on('update_run_status', namespace='/agent')
 async def handle_run_status_update(sid: str, data: dict[str, Any]) -> None:
     try:
@@ -136,9 +313,7 @@ async def handle_run_status_update(sid: str, data: dict[str, Any]) -> None:
 # EVENT EMITTERS
 
 async def emit_run_created(run: SerializedRun) -> None:
-    data = jsonable_encoder(run)
-    await sio.emit('run_created', data, namespace='/ui')
+    await emit_ui('run_created', run, run_rooms(run.id, run.bot_id, run.agent_id))
 
 async def emit_run_updated(run: SerializedRun) -> None:
-    data = jsonable_encoder(run)
-    await sio.emit('run_updated', data, namespace='/ui')
\ No newline at end of file
+    await emit_ui('run_updated', run, run_rooms(run.id, run.bot_id, run.agent_id))
\ No newline at end of file
@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import heapq
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from croniter import croniter
+
+from app.utils.config import SCHEDULE_SPREAD_SECONDS
+
+
+class CronCache:
+    """Compiled croniter per expression, with memoized next fire times.
+
+    Bots sharing an expression share its iterator, so scheduling thousands of
+    `*/5 * * * *` bots costs one cron evaluation per fire time, not one per bot.
+    """
+
+    def __init__(self, max_memo: int = 4096) -> None:
+        self._crons: dict[str, Any] = {}
+        self._memo: dict[tuple[str, datetime], datetime] = {}
+        self._max_memo = max_memo
+
+    def next_after(self, schedule: str, after: datetime) -> datetime:
+        key = (schedule, after)
+        next_fire = self._memo.get(key)
+        if next_fire is None:
+            cron = self._crons.get(schedule)
+            if cron is None:
+                cron = self._crons[schedule] = croniter(schedule, after)
+            else:
+                cron.set_current(after, force=True)
+            next_fire = cron.get_next(datetime)
+            if len(self._memo) >= self._max_memo:
+                self._memo.clear()
+            self._memo[key] = next_fire
+        return next_fire
+
+
+def schedule_offset(bot_id: str, spread: Optional[float] = None) -> timedelta:
+    # Deterministic offset within the bot's spread window (or the global one),
+    # spreading bots with the same schedule evenly across the window
+    window = SCHEDULE_SPREAD_SECONDS if spread is None else spread
+    if window <= 0:
+        return timedelta()
+    fraction = int.from_bytes(hashlib.sha256(bot_id.encode()).digest()[:8], "big") / 2 ** 64
+    return timedelta(milliseconds=int(fraction * window * 1000))
+
+
+@dataclass
+class ScheduleEntry:
+    schedule: str
+    next_fire: datetime
+    version: int
+    offset: timedelta = timedelta()
+
+    @property
+    def start_time(self) -> datetime:
+        return self.next_fire + self.offset
+
+
+class ScheduleQueue:
+    """Priority queue of (start_time, bot_id) for every scheduled bot.
+
+    The start time is the bot's next cron fire time plus its spread offset. A
+    tick only touches the bots that are actually due. Entries replaced by
+    upsert/remove are skipped lazily.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[datetime, str, int]] = []
+        self._entries: dict[str, ScheduleEntry] = {}
+        self._version = 0
+        self._crons = CronCache()
+        self._changed: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, bot_id: str) -> bool:
+        return bot_id in self._entries
+
+    def _push(self, bot_id: str, entry: ScheduleEntry) -> None:
+        heapq.heappush(self._heap, (entry.start_time, bot_id, entry.version))
+        # Superseded entries are dropped lazily; rebuild once they dominate the heap
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap if self._is_current(item)]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, item: tuple[datetime, str, int]) -> bool:
+        entry = self._entries.get(item[1])
+        return entry is not None and entry.version == item[2]
+
+    def get(self, bot_id: str) -> Optional[ScheduleEntry]:
+        return self._entries.get(bot_id)
+
+    def upsert(self, bot_id: str, schedule: Optional[str], now: datetime, offset: timedelta = timedelta()) -> None:
+        if not schedule:
+            self.remove(bot_id)
+            return
+        current = self._entries.get(bot_id)
+        if current and current.schedule == schedule and current.offset == offset:
+            return
+
+        next_fire = self._crons.next_after(schedule, now)
+        self._version += 1
+        entry = ScheduleEntry(schedule, next_fire, self._version, offset)
+        self._entries[bot_id] = entry
+        self._push(bot_id, entry)
+        self._notify()
+
+    def remove(self, bot_id: str) -> None:
+        self._entries.pop(bot_id, None)
+
+    def clear(self) -> None:
+        self._heap = []
+        self._entries = {}
+        self._notify()
+
+    def _notify(self) -> None:
+        if self._changed is not None:
+            self._changed.set()
+
+    async def wait_changed(self, timeout: float) -> None:
+        # Returns after `timeout` seconds, or as soon as a bot is (re)scheduled
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    def peek(self) -> Optional[datetime]:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, until: datetime) -> list[tuple[str, datetime, datetime]]:
+        # (bot_id, fire_time, start_time) of every start up to `until`,
+        # advancing each bot to its next fire time
+        due: list[tuple[str, datetime, datetime]] = []
+        while self._heap and self._heap[0][0] <= until:
+            item = heapq.heappop(self._heap)
+            if not self._is_current(item):
+                continue
+            start_time, bot_id, _ = item
+            entry = self._entries[bot_id]
+            due.append((bot_id, entry.next_fire, start_time))
+            entry.next_fire = self._crons.next_after(entry.schedule, entry.next_fire)
+            heapq.heappush(self._heap, (entry.start_time, bot_id, entry.version))
+        return due
+
+
+schedule_queue = ScheduleQueue()
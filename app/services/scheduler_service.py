@@ -1,42 +1,155 @@
+import asyncio
+import time
 from bson import ObjectId
-from croniter import croniter, CroniterBadCronError
-from datetime import datetime
+from croniter import CroniterBadCronError
+from datetime import datetime, timedelta
+from typing import Any, Optional
 
-from app.models import CreateRun, RunStatus, UpdateRun
+from app.models import CreateRun, OverlapPolicy, RunPriority, RunStatus
 from ..database import bots_collection, runs_collection
-from .run_service import create_run, serialize_run, update_run
-from .bot_service import serialize_bot, start_bot_run
+from .run_service import cancel_queued_runs, count_unfinished_runs, create_scheduled_runs, serialize_run, update_run_status
+from .dispatch_service import dispatch_queued_runs
+from .lease_service import scheduler_lease
+from .schedule_queue import schedule_offset, schedule_queue
+from ..utils.config import SCHEDULE_SYNC_INTERVAL
+from ..utils.metrics import OVERLAP_SUPPRESSED_RUNS, SCHEDULED_RUNS, SCHEDULER_TICK_SECONDS
 
-async def schedule_bot_runs() -> None:
+# How often a replica that is not the leader checks whether it has become one
+FOLLOWER_POLL_INTERVAL = 1.0
+
+SCHEDULE_PROJECTION = {"schedule": 1, "schedule_spread": 1, "priority": 1, "max_concurrency": 1, "overlap_policy": 1}
+
+schedule_task: Optional["asyncio.Task[None]"] = None
+
+def upsert_scheduled_bot(bot_id: str, bot: dict[str, Any], now: datetime) -> None:
+    schedule = bot.get("schedule")
+    try:
+        schedule_queue.upsert(bot_id, schedule, now, schedule_offset(bot_id, bot.get("schedule_spread")))
+    except (CroniterBadCronError, ValueError) as e:
+        print(f"[Scheduler] Invalid CRON expression for bot {bot_id}: {schedule} - {e}")
+
+async def load_schedule_queue() -> None:
+    now = datetime.now()
+    schedule_queue.clear()
+    bots_cursor = bots_collection.find({"schedule": {"$type": "string"}}, SCHEDULE_PROJECTION)
+    async for bot in bots_cursor:
+        upsert_scheduled_bot(str(bot["_id"]), bot, now)
+    print(f"[Scheduler] Loaded {len(schedule_queue)} scheduled bots")
+
+async def sync_schedule_queue(since: datetime) -> None:
+    # Bots created or changed through other replicas; deletions are caught in queue_due_runs
+    now = datetime.now()
+    bots_cursor = bots_collection.find({"updated_at": {"$gte": since}}, SCHEDULE_PROJECTION)
+    async for bot in bots_cursor:
+        upsert_scheduled_bot(str(bot["_id"]), bot, now)
+
+async def apply_overlap_policies(due: list[tuple[str, datetime, datetime]],
+                                 bots: dict[str, dict[str, Any]]) -> list[tuple[str, datetime, datetime]]:
+    # Drops the fires of skip bots that are at their limit and cancels the
+    # queued runs of replace bots; queue bots are left to the dispatcher
+    policies = {bot_id: bots[bot_id].get("overlap_policy") or OverlapPolicy.QUEUE for bot_id, _, _ in due}
+    replaced = [bot_id for bot_id, policy in policies.items() if policy == OverlapPolicy.REPLACE]
+    if replaced:
+        cancelled = await cancel_queued_runs(replaced)
+        OVERLAP_SUPPRESSED_RUNS.labels(OverlapPolicy.REPLACE.value).inc(cancelled)
+
+    skipping = [bot_id for bot_id, policy in policies.items() if policy == OverlapPolicy.SKIP]
+    if not skipping:
+        return due
+    unfinished = await count_unfinished_runs(skipping)
+    allowed = []
+    for bot_id, fire_time, start_time in due:
+        if policies[bot_id] == OverlapPolicy.SKIP and unfinished.get(bot_id, 0) >= (bots[bot_id].get("max_concurrency") or 1):
+            OVERLAP_SUPPRESSED_RUNS.labels(OverlapPolicy.SKIP.value).inc()
+            continue
+        allowed.append((bot_id, fire_time, start_time))
+    return allowed
+
+async def queue_due_runs() -> None:
     now = datetime.now()
-    print(f"[Scheduler] Checking scheduled bots at {now.isoformat()}")
     try:
-        bots_cursor = bots_collection.find({"schedule": {"$ne": None}})
-        bots = await bots_cursor.to_list(length=None)
-        for bot in bots:
-            serialized_bot = serialize_bot(bot)
-            bot_id = serialized_bot.id
-            cron = bot["schedule"]
-            try:
-                cron_iter = croniter(cron, now)
-                next_run_time = cron_iter.get_next(datetime)
-                print(f"[Scheduler] Bot {bot_id} scheduled to run at {next_run_time.isoformat()} with CRON {cron}")
-
-                # Check if there are any existing scheduled runs for this bot
-                existing_scheduled_runs = await runs_collection.find_one({"bot_id": bot_id, "status": RunStatus.SCHEDULED, "start_time": next_run_time})
-                if existing_scheduled_runs:
-                    print(f"[Scheduler] Existing scheduled run found for bot {bot_id}, skipping scheduling: {existing_scheduled_runs}")
-                    continue
-
-                # Schedule the run if the next run time is not yet scheduled
-                if next_run_time > now:
-                    await create_run(CreateRun(bot_id=bot_id, status=RunStatus.SCHEDULED, start_time=next_run_time))
-            except CroniterBadCronError as e:
-                print(f"[Scheduler] Invalid CRON expression for bot {bot_id}: {cron} - {e}")
-            except Exception as e:
-                print(f"[Scheduler] Unexpected error while scheduling bot {bot_id}: {e}")
+        due = schedule_queue.pop_due(now)
+        if not due:
+            return
+
+        started = time.perf_counter()
+        # Skip bots deleted or rescheduled through another replica since the last sync
+        bots_cursor = bots_collection.find({"_id": {"$in": [ObjectId(bot_id) for bot_id, _, _ in due]}}, SCHEDULE_PROJECTION)
+        bots = {str(bot["_id"]): bot async for bot in bots_cursor}
+        current = []
+        for bot_id, fire_time, start_time in due:
+            bot = bots.get(bot_id, {})
+            entry = schedule_queue.get(bot_id)
+            if (entry and entry.schedule == bot.get("schedule")
+                    and entry.offset == schedule_offset(bot_id, bot.get("schedule_spread"))):
+                current.append((bot_id, fire_time, start_time))
+            else:
+                upsert_scheduled_bot(bot_id, bot, now)
+        current = await apply_overlap_policies(current, bots)
+        if not current:
+            return
+
+        # Due runs go straight to the queue; a unique index on (bot_id, scheduled_time)
+        # turns repeats from other processes into no-ops. scheduled_time stays the
+        # logical fire time, start_time includes the bot's spread offset.
+        runs = await create_scheduled_runs([
+            CreateRun(bot_id=bot_id, status=RunStatus.QUEUED, start_time=start_time, scheduled_time=fire_time,
+                      priority=bots[bot_id].get("priority") or RunPriority.HIGH)
+            for bot_id, fire_time, start_time in current
+        ])
+        SCHEDULED_RUNS.inc(len(runs))
+        SCHEDULER_TICK_SECONDS.observe(time.perf_counter() - started)
+        print(f"[Scheduler] Queued {len(runs)} of {len(current)} due runs at {now.isoformat()}")
     except Exception as e:
-        print(f"[Scheduler] Unexpected error while fetching bots: {e}")
+        print(f"[Scheduler] Unexpected error while queuing due runs: {e}")
+
+async def run_schedule_loop() -> None:
+    # Only the leader schedules. It sleeps until the earliest fire time, until a
+    # bot is (re)scheduled through this replica, or until the next sync is due.
+    loaded_token: Optional[int] = None
+    synced_at = datetime.now()
+    while True:
+        try:
+            if not scheduler_lease.is_leader:
+                loaded_token = None
+                await asyncio.sleep(FOLLOWER_POLL_INTERVAL)
+                continue
+            if scheduler_lease.token != loaded_token:
+                # Bots may have changed anywhere while another replica was leading
+                synced_at = datetime.now()
+                await load_schedule_queue()
+                loaded_token = scheduler_lease.token
+            elif (datetime.now() - synced_at).total_seconds() >= SCHEDULE_SYNC_INTERVAL:
+                # Overlap the previous window a little to allow for clock skew between replicas
+                since = synced_at - timedelta(seconds=SCHEDULE_SYNC_INTERVAL)
+                synced_at = datetime.now()
+                await sync_schedule_queue(since)
+        except Exception as e:
+            print(f"[Scheduler] Unexpected error while loading scheduled bots: {e}")
+            await asyncio.sleep(FOLLOWER_POLL_INTERVAL)
+            continue
+
+        next_fire = schedule_queue.peek()
+        delay = SCHEDULE_SYNC_INTERVAL if next_fire is None else (next_fire - datetime.now()).total_seconds()
+        if delay > 0:
+            await schedule_queue.wait_changed(min(delay, SCHEDULE_SYNC_INTERVAL))
+            continue
+        await queue_due_runs()
+
+def start_schedule_loop() -> None:
+    global schedule_task
+    if schedule_task is None or schedule_task.done():
+        schedule_task = asyncio.create_task(run_schedule_loop())
+
+async def stop_schedule_loop() -> None:
+    global schedule_task
+    if schedule_task is not None:
+        schedule_task.cancel()
+        try:
+            await schedule_task
+        except asyncio.CancelledError:
+            pass
+        schedule_task = None
 
 async def monitor_queued_runs() -> None:
     now = datetime.now()
@@ -51,28 +164,12 @@ async def monitor_queued_runs() -> None:
             bot_id = serialized_run.bot_id
             run_id = serialized_run.id
             try:
-                await update_run(run_id, UpdateRun(status=RunStatus.QUEUED))
+                # Only if still scheduled, so a run queued and dispatched meanwhile is left alone
+                await update_run_status(run_id, RunStatus.QUEUED, from_statuses=[RunStatus.SCHEDULED])
             except Exception as e:
                 print(f"[Monitor] Unexpected error while queuing run {run_id}: {e}")
 
-        # Find all queued runs and attempt to start them
-        queued_runs_cursor = runs_collection.find({"status": RunStatus.QUEUED}).sort("start_time", 1)
-        queued_runs = await queued_runs_cursor.to_list(length=None)
-        print(f"[Monitor] Found {len(queued_runs)} queued runs")
-        for run in queued_runs:
-            serialized_run = serialize_run(run)
-            bot_id = serialized_run.bot_id
-            run_id = serialized_run.id
-            try:
-                bot = await bots_collection.find_one({"_id": ObjectId(bot_id)})
-                if not bot:
-                    print(f"[Monitor] Bot {bot_id} not found for queued run {run_id}")
-                    continue
-
-                success = await start_bot_run(bot_id, run_id)
-                if not success:
-                    print(f"[Monitor] Failed to start queued run {run_id}")
-            except Exception as e:
-                print(f"[Monitor] Unexpected error while starting run {run_id}: {e}")
+        # Safety net for runs that no notification reached
+        await dispatch_queued_runs()
     except Exception as e:
         print(f"[Monitor] Unexpected error while fetching queued runs: {e}")
\ No newline at end of file
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from pymongo import UpdateOne
+
+from app.database import bot_stats_collection
+from app.models import BotStats, RunStatsBucket, RunStatus, StatsGranularity
+from app.utils.config import STATS_DAY_RETENTION_DAYS, STATS_HOUR_RETENTION_DAYS, STATS_MINUTE_RETENTION_DAYS
+from app.utils.sketch import QuantileSketch
+
+# Every finished run is added to the minute, hour and day bucket it ended in.
+# A bucket document holds counters and the bucket counts of a duration sketch,
+# all updated with $inc, so reading stats costs one document per bucket no
+# matter how many runs it covers.
+
+BUCKET_SIZES = {
+    StatsGranularity.MINUTE: timedelta(minutes=1),
+    StatsGranularity.HOUR: timedelta(hours=1),
+    StatsGranularity.DAY: timedelta(days=1),
+}
+RETENTION = {
+    StatsGranularity.MINUTE: timedelta(days=STATS_MINUTE_RETENTION_DAYS),
+    StatsGranularity.HOUR: timedelta(days=STATS_HOUR_RETENTION_DAYS),
+    StatsGranularity.DAY: timedelta(days=STATS_DAY_RETENTION_DAYS),
+}
+# Window returned when no `since` is given
+DEFAULT_WINDOWS = {
+    StatsGranularity.MINUTE: timedelta(hours=1),
+    StatsGranularity.HOUR: timedelta(days=1),
+    StatsGranularity.DAY: timedelta(days=30),
+}
+# Bucket keys depend on the accuracy, so it must not change once stats exist
+DURATION_ACCURACY = 0.01
+QUANTILES = {"duration_p50": 0.5, "duration_p90": 0.9, "duration_p95": 0.95, "duration_p99": 0.99}
+
+def bucket_start(timestamp: datetime, granularity: StatsGranularity) -> datetime:
+    if granularity == StatsGranularity.MINUTE:
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == StatsGranularity.HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def record_run_stats(bot_id: str, status: RunStatus, start_time: Optional[datetime], end_time: datetime) -> None:
+    inc: dict[str, Any] = {"runs": 1, "completed" if status == RunStatus.COMPLETED else "errors": 1}
+    update: dict[str, Any] = {"$inc": inc}
+    if start_time:
+        duration = max((end_time - start_time).total_seconds(), 0.0)
+        inc[f"durations.{QuantileSketch(DURATION_ACCURACY).key(duration)}"] = 1
+        inc["duration_sum"] = duration
+        inc["duration_count"] = 1
+        update["$min"] = {"duration_min": duration}
+        update["$max"] = {"duration_max": duration}
+
+    requests = []
+    for granularity, size in BUCKET_SIZES.items():
+        start = bucket_start(end_time, granularity)
+        requests.append(UpdateOne(
+            {"bot_id": bot_id, "granularity": granularity.value, "start": start},
+            {**update, "$setOnInsert": {"expire_at": start + size + RETENTION[granularity]}},
+            upsert=True
+        ))
+    await bot_stats_collection.bulk_write(requests, ordered=False)
+
+class StatsAccumulator:
+    def __init__(self, start: datetime) -> None:
+        self.start = start
+        self.runs = 0
+        self.completed = 0
+        self.errors = 0
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.duration_min: Optional[float] = None
+        self.duration_max: Optional[float] = None
+        self.sketch = QuantileSketch(DURATION_ACCURACY)
+
+    def add(self, doc: dict[str, Any]) -> None:
+        self.runs += doc.get("runs", 0)
+        self.completed += doc.get("completed", 0)
+        self.errors += doc.get("errors", 0)
+        self.duration_sum += doc.get("duration_sum", 0.0)
+        self.duration_count += doc.get("duration_count", 0)
+        minimum, maximum = doc.get("duration_min"), doc.get("duration_max")
+        if minimum is not None and (self.duration_min is None or minimum < self.duration_min):
+            self.duration_min = minimum
+        if maximum is not None and (self.duration_max is None or maximum > self.duration_max):
+            self.duration_max = maximum
+        self.sketch.merge_counts(doc.get("durations", {}))
+
+    def bucket(self) -> RunStatsBucket:
+        return RunStatsBucket(
+            start=self.start,
+            runs=self.runs,
+            completed=self.completed,
+            errors=self.errors,
+            success_ratio=self.completed / self.runs if self.runs else None,
+            duration_mean=self.duration_sum / self.duration_count if self.duration_count else None,
+            duration_min=self.duration_min,
+            duration_max=self.duration_max,
+            **{field: self.sketch.quantile(q) for field, q in QUANTILES.items()}
+        )
+
+async def get_bot_stats(bot_id: str, granularity: StatsGranularity = StatsGranularity.HOUR,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None) -> BotStats:
+    until = until or datetime.now()
+    since = since or until - DEFAULT_WINDOWS[granularity]
+    cursor = bot_stats_collection.find(
+        {"bot_id": bot_id, "granularity": granularity.value, "start": {"$gte": bucket_start(since, granularity), "$lt": until}},
+        {"_id": 0, "expire_at": 0}
+    ).sort("start", 1)
+
+    total = StatsAccumulator(since)
+    buckets = []
+    async for doc in cursor:
+        bucket = StatsAccumulator(doc["start"])
+        bucket.add(doc)
+        total.add(doc)
+        buckets.append(bucket.bucket())
+    return BotStats(bot_id=bot_id, granularity=granularity, since=since, until=until,
+                    total=total.bucket(), buckets=buckets)
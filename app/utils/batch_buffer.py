@@ -0,0 +1,99 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Queued by stop() to tell the run loop to flush what it holds and exit
+_STOP: Any = object()
+
+
+class BatchBuffer(Generic[T]):
+    """Collects items and hands them to `flush` in batches.
+
+    A batch is flushed once it reaches `max_batch` items or its oldest item has
+    waited `max_delay` seconds. `put` blocks while `max_pending` items are
+    waiting, which pushes back on producers when the database falls behind.
+    """
+
+    def __init__(self, name: str, flush: Callable[[list[T]], Awaitable[None]],
+                 max_batch: int, max_delay: float, max_pending: int) -> None:
+        self.name = name
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue[T] = asyncio.Queue(maxsize=max_pending)
+        self.task: Optional[asyncio.Task[None]] = None
+        self.closing = False
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def put(self, item: T) -> None:
+        if not self.running or self.closing:
+            await self.flush([item])
+            return
+        await self.queue.put(item)
+
+    def start(self) -> None:
+        if not self.running:
+            self.closing = False
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        # The task is not cancelled: on Python < 3.12 wait_for can swallow the
+        # cancellation when an item is ready. It stops at the sentinel instead,
+        # and anything queued behind the sentinel is drained here.
+        if self.task is not None:
+            self.closing = True
+            if self.running:
+                await self.queue.put(_STOP)
+            await self.task
+            self.task = None
+        await self.drain()
+
+    async def drain(self) -> None:
+        while not self.queue.empty():
+            batch: list[T] = []
+            self.take_ready(batch)
+            if batch:
+                await self.flush_batch(batch)
+
+    def take_ready(self, batch: list[T]) -> bool:
+        # Moves waiting items into the batch, returning True once the sentinel is reached
+        while len(batch) < self.max_batch and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    async def flush_batch(self, batch: list[T]) -> None:
+        try:
+            await self.flush(batch)
+        except Exception as e:
+            print(f"[{self.name}] Error flushing {len(batch)} items: {e}")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                stopping = self.take_ready(batch)
+                remaining = deadline - loop.time()
+                if stopping or len(batch) >= self.max_batch or remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self.flush_batch(batch)
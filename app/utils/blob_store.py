@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from .config import BLOB_STORE_PATH
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+CHUNK_SIZE = 64 * 1024
+
+# Content-addressed file store: blobs are named by their sha256 so identical
+# content is only written once and never changes after it has been written
+
+def blob_path(digest: str) -> Path:
+    if not DIGEST_PATTERN.match(digest):
+        raise ValueError(f"Invalid blob digest: {digest}")
+    return Path(BLOB_STORE_PATH) / digest[:2] / digest[2:4] / digest
+
+def write_blob(digest: str, data: bytes) -> None:
+    path = blob_path(digest)
+    if path.exists():
+        # Reused content counts as freshly written, so garbage collection leaves it alone
+        os.utime(path)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so readers never see a partial blob
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+async def put_blob(data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    await asyncio.to_thread(write_blob, digest, data)
+    return digest
+
+def blob_exists(digest: str) -> bool:
+    try:
+        return blob_path(digest).is_file()
+    except ValueError:
+        return False
+
+def list_blobs(modified_before: float) -> list[str]:
+    # Digests of the blobs last written before the given timestamp
+    root = Path(BLOB_STORE_PATH)
+    if not root.is_dir():
+        return []
+    return [path.name for path in root.glob("*/*/*")
+            if DIGEST_PATTERN.match(path.name) and path.stat().st_mtime < modified_before]
+
+def delete_blob(digest: str, modified_before: float) -> bool:
+    # Checked again right before unlinking, in case the blob was reused meanwhile
+    path = blob_path(digest)
+    try:
+        if path.stat().st_mtime >= modified_before:
+            return False
+        path.unlink()
+        return True
+    except FileNotFoundError:
+        return False
+
+def read_blob_chunk(path: Path, offset: int) -> bytes:
+    with open(path, "rb") as blob_file:
+        blob_file.seek(offset)
+        return blob_file.read(CHUNK_SIZE)
+
+async def iter_blob(digest: str) -> AsyncIterator[bytes]:
+    path = blob_path(digest)
+    offset = 0
+    while True:
+        chunk = await asyncio.to_thread(read_blob_chunk, path, offset)
+        if not chunk:
+            return
+        offset += len(chunk)
+        yield chunk
+
+def sniff_media_type(head: bytes) -> Optional[str]:
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
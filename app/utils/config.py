@@ -13,4 +13,87 @@ DEBUG = os.getenv("DEBUG", "False").lower() in ['true', '1']
 # Logging settings
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
-HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", 10))
\ No newline at end of file
+HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", 10))
+
+# Dispatch settings
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", 10))
+AGENT_DEFAULT_SLOTS = int(os.getenv("AGENT_DEFAULT_SLOTS", 1))
+# Share of dispatches each run priority gets while several have runs waiting
+RUN_PRIORITY_WEIGHTS = {
+    "high": float(os.getenv("RUN_PRIORITY_WEIGHT_HIGH", 8)),
+    "normal": float(os.getenv("RUN_PRIORITY_WEIGHT_NORMAL", 2)),
+    "low": float(os.getenv("RUN_PRIORITY_WEIGHT_LOW", 1)),
+}
+
+# Seconds a replica may keep dispatching a bot's previous script after it was changed
+# through another replica
+BOT_CACHE_TTL = float(os.getenv("BOT_CACHE_TTL", 10))
+
+# Bot script versions are stored as deltas, with a full snapshot every this many versions
+BOT_VERSION_SNAPSHOT_INTERVAL = int(os.getenv("BOT_VERSION_SNAPSHOT_INTERVAL", 10))
+
+# Agent HTTP client settings
+AGENT_HTTP_TIMEOUT = float(os.getenv("AGENT_HTTP_TIMEOUT", 10))
+AGENT_HTTP_CONNECT_TIMEOUT = float(os.getenv("AGENT_HTTP_CONNECT_TIMEOUT", 5))
+AGENT_HTTP_MAX_CONNECTIONS = int(os.getenv("AGENT_HTTP_MAX_CONNECTIONS", 100))
+AGENT_HTTP_MAX_KEEPALIVE = int(os.getenv("AGENT_HTTP_MAX_KEEPALIVE", 20))
+AGENT_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AGENT_HTTP_KEEPALIVE_EXPIRY", 60))
+AGENT_HTTP2 = os.getenv("AGENT_HTTP2", "True").lower() in ['true', '1']
+
+# Run log ingestion settings
+RUN_LOG_BATCH_SIZE = int(os.getenv("RUN_LOG_BATCH_SIZE", 500))
+RUN_LOG_FLUSH_INTERVAL = float(os.getenv("RUN_LOG_FLUSH_INTERVAL", 0.25))
+RUN_LOG_BUFFER_LIMIT = int(os.getenv("RUN_LOG_BUFFER_LIMIT", 10000))
+
+# Bulk NDJSON uploads are written in chunks of this many records
+BATCH_UPLOAD_CHUNK_SIZE = int(os.getenv("BATCH_UPLOAD_CHUNK_SIZE", 500))
+
+# Screenshots and other large payloads are kept out of Mongo in this content-addressed store
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", "data/blobs")
+# Blobs no run event references are deleted once they are BLOB_GC_GRACE_HOURS old; the grace
+# period covers blobs written for events that are not inserted yet
+BLOB_GC_GRACE_HOURS = float(os.getenv("BLOB_GC_GRACE_HOURS", 24))
+BLOB_GC_BATCH_SIZE = int(os.getenv("BLOB_GC_BATCH_SIZE", 1000))
+
+# List endpoint page sizes
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+# Number of documents fetched and flushed per chunk when streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+
+# Retention of run logs and events. Finished runs are archived to ARCHIVE_PATH once they
+# are ARCHIVE_AFTER_HOURS old; their documents then expire through a TTL index.
+RUN_LOG_RETENTION_DAYS = int(os.getenv("RUN_LOG_RETENTION_DAYS", 30))
+RUN_EVENT_RETENTION_DAYS = int(os.getenv("RUN_EVENT_RETENTION_DAYS", 30))
+ARCHIVE_AFTER_HOURS = int(os.getenv("ARCHIVE_AFTER_HOURS", 24))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 100))
+# Each archival pass works through batches until no run is left or this many seconds have
+# passed; it runs every 10 minutes, so keep this below 600
+ARCHIVE_TIME_BUDGET = float(os.getenv("ARCHIVE_TIME_BUDGET", 480))
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", "data/archives")
+
+# Leader lease for the jobs that must run on a single orchestrator replica. The leader
+# renews it every LEADER_LEASE_RENEW_INTERVAL seconds; a replica that stops renewing
+# loses it after LEADER_LEASE_TTL seconds.
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", 15))
+LEADER_LEASE_RENEW_INTERVAL = float(os.getenv("LEADER_LEASE_RENEW_INTERVAL", 5))
+
+# Scheduled runs start at a deterministic offset of up to this many seconds after their
+# fire time, so bots sharing a schedule do not all start at once. 0 disables spreading.
+SCHEDULE_SPREAD_SECONDS = float(os.getenv("SCHEDULE_SPREAD_SECONDS", 0))
+
+# How often the leader picks up bots created or changed through other replicas
+SCHEDULE_SYNC_INTERVAL = float(os.getenv("SCHEDULE_SYNC_INTERVAL", 5))
+
+# Message queue shared by all orchestrator workers so that socket events emitted by
+# one reach UI clients connected to another: redis://... (needs redis), amqp://...
+# (needs aio-pika) or memory:// for an in-process stand-in. Empty keeps events within
+# the process.
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "socketio")
+
+# How long per-bot run statistics are kept at each granularity
+STATS_MINUTE_RETENTION_DAYS = int(os.getenv("STATS_MINUTE_RETENTION_DAYS", 2))
+STATS_HOUR_RETENTION_DAYS = int(os.getenv("STATS_HOUR_RETENTION_DAYS", 90))
+STATS_DAY_RETENTION_DAYS = int(os.getenv("STATS_DAY_RETENTION_DAYS", 730))
@@ -1,6 +1,9 @@
 from croniter import croniter, CroniterBadCronError
 
 def validate_cron_expression(cron: str) -> bool:
+    # Standard 5 field expressions, or 6 fields with seconds as the last one
+    if len(cron.split()) > 6:
+        return False
     try:
         croniter(cron)
         return True
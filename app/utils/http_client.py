@@ -0,0 +1,113 @@
+import importlib.util
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+import httpx
+
+from .config import (AGENT_HTTP2, AGENT_HTTP_CONNECT_TIMEOUT, AGENT_HTTP_KEEPALIVE_EXPIRY, AGENT_HTTP_MAX_CONNECTIONS,
+                     AGENT_HTTP_MAX_KEEPALIVE, AGENT_HTTP_TIMEOUT)
+
+# HTTP/2 needs the optional h2 package (httpx[http2]); fall back to HTTP/1.1 keep-alive without it
+HTTP2_ENABLED = AGENT_HTTP2 and importlib.util.find_spec("h2") is not None
+
+@dataclass
+class AgentRequestStats:
+    requests: int = 0
+    failures: int = 0
+    in_flight: int = 0
+    total_seconds: float = 0.0
+
+@dataclass
+class OriginStats:
+    requests: int = 0
+    in_flight: int = 0
+    http2: int = 0
+
+agent_client: Optional[httpx.AsyncClient] = None
+agent_request_stats: dict[str, AgentRequestStats] = {}
+agent_origin_stats: dict[str, OriginStats] = {}
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """Transport wrapper that counts requests per origin (agent public_url).
+
+    It only relies on the public transport API and response extensions, not on
+    the connection pool's internals, so it keeps working across httpx upgrades.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        origin = f"{url.scheme}://{url.host}" + (f":{url.port}" if url.port else "")
+        stats = agent_origin_stats.setdefault(origin, OriginStats())
+        stats.requests += 1
+        stats.in_flight += 1
+        try:
+            response = await self.transport.handle_async_request(request)
+        finally:
+            stats.in_flight -= 1
+        if response.extensions.get("http_version") == b"HTTP/2":
+            stats.http2 += 1
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def create_agent_client() -> httpx.AsyncClient:
+    # httpx keeps a keep-alive pool per origin, i.e. per agent public_url
+    transport = httpx.AsyncHTTPTransport(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=AGENT_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=AGENT_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=AGENT_HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    return httpx.AsyncClient(
+        transport=CountingTransport(transport),
+        timeout=httpx.Timeout(AGENT_HTTP_TIMEOUT, connect=AGENT_HTTP_CONNECT_TIMEOUT)
+    )
+
+async def open_agent_client() -> None:
+    global agent_client
+    if agent_client is None or agent_client.is_closed:
+        agent_client = create_agent_client()
+
+async def close_agent_client() -> None:
+    global agent_client
+    if agent_client is not None:
+        await agent_client.aclose()
+        agent_client = None
+
+def get_agent_client() -> httpx.AsyncClient:
+    global agent_client
+    if agent_client is None or agent_client.is_closed:
+        agent_client = create_agent_client()
+    return agent_client
+
+async def post_to_agent(agent_id: str, url: str, payload: dict[str, Any]) -> httpx.Response:
+    stats = agent_request_stats.setdefault(agent_id, AgentRequestStats())
+    stats.requests += 1
+    stats.in_flight += 1
+    started = time.perf_counter()
+    try:
+        response = await get_agent_client().post(url, json=payload)
+        response.raise_for_status()
+        return response
+    except httpx.HTTPError:
+        stats.failures += 1
+        raise
+    finally:
+        stats.in_flight -= 1
+        stats.total_seconds += time.perf_counter() - started
+
+def agent_pool_stats() -> dict[str, Any]:
+    return {
+        "http2_enabled": HTTP2_ENABLED,
+        "origins": {origin: asdict(stats) for origin, stats in agent_origin_stats.items()},
+        "agents": {agent_id: asdict(stats) for agent_id, stats in agent_request_stats.items()}
+    }
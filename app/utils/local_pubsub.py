@@ -0,0 +1,29 @@
+import asyncio
+from typing import Any, AsyncIterator
+
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+    """Socket.IO client manager backed by an in-process broker.
+
+    Stands in for Redis or AMQP in tests and local development: every server
+    in the process using the same channel receives every message, exactly as
+    separate workers sharing a real message queue would.
+    """
+
+    name = 'localpubsub'
+    subscribers: dict[str, list["asyncio.Queue[dict[str, Any]]"]] = {}
+
+    async def _publish(self, data: dict[str, Any]) -> None:
+        for queue in self.subscribers.get(self.channel, []):
+            queue.put_nowait(data)
+
+    async def _listen(self) -> AsyncIterator[dict[str, Any]]:
+        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self.subscribers.setdefault(self.channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.subscribers[self.channel].remove(queue)
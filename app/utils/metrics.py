@@ -0,0 +1,214 @@
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, ContextManager, Generic, Iterator, Optional, Sequence, TypeVar, Union
+
+from pymongo import monitoring
+
+# Minimal Prometheus instrumentation, rendered in the text exposition format by
+# render_metrics(). Updates are plain attribute arithmetic on the event loop
+# thread, so they need no locks and are cheap enough to leave on everywhere.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class CounterValue:
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramValue:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+V = TypeVar("V", CounterValue, GaugeValue, HistogramValue)
+
+
+class Metric(ABC, Generic[V]):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: dict[tuple[str, ...], V] = {}
+        if not self.labelnames:
+            self.labels()
+        registry.append(self)
+
+    @abstractmethod
+    def new_value(self) -> V:
+        ...
+
+    def labels(self, *values: str) -> V:
+        value = self.children.get(values)
+        if value is None:
+            value = self.children[values] = self.new_value()
+        return value
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric[CounterValue]):
+    kind = "counter"
+
+    def new_value(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[str]:
+        for values, counter in list(self.children.items()):
+            yield f"{self.name}{format_labels(self.labelnames, values)} {format_value(counter.value)}"
+
+
+class Gauge(Metric[GaugeValue]):
+    kind = "gauge"
+
+    def new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def samples(self) -> Iterator[str]:
+        for values, gauge in list(self.children.items()):
+            yield f"{self.name}{format_labels(self.labelnames, values)} {format_value(gauge.value)}"
+
+
+class Histogram(Metric[HistogramValue]):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> ContextManager[None]:
+        return self.labels().time()
+
+    def samples(self) -> Iterator[str]:
+        for values, histogram in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), histogram.counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, values, f'le="{format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {format_value(histogram.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+registry: list[Metric[Any]] = []
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+# Scheduler and dispatch
+SCHEDULER_TICK_SECONDS = Histogram("orchestrator_scheduler_tick_seconds", "Time spent queuing the runs of one scheduler tick")
+SCHEDULED_RUNS = Counter("orchestrator_scheduled_runs_total", "Runs created from bot schedules")
+OVERLAP_SUPPRESSED_RUNS = Counter("orchestrator_overlap_suppressed_runs_total",
+                                  "Runs skipped or cancelled by a bot's overlap policy", ["policy"])
+RUNS_BY_STATUS = Gauge("orchestrator_runs", "Runs that have not finished yet, by status", ["status"])
+DISPATCH_QUEUE_WAIT_SECONDS = Histogram("orchestrator_dispatch_queue_wait_seconds",
+                                        "Time from a run's start time until it is handed to an agent",
+                                        buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+DISPATCH_SECONDS = Histogram("orchestrator_dispatch_seconds", "Duration of run start requests to agents", ["agent_id"])
+DISPATCHED_RUNS = Counter("orchestrator_dispatched_runs_total", "Runs handed to an agent", ["agent_id"])
+DISPATCH_FAILURES = Counter("orchestrator_dispatch_failures_total", "Runs an agent failed to start", ["agent_id"])
+
+# Ingestion
+RUN_LOGS_INGESTED = Counter("orchestrator_run_logs_ingested_total", "Run log lines written")
+RUN_EVENTS_INGESTED = Counter("orchestrator_run_events_ingested_total", "Run events written")
+
+# Socket.IO
+SOCKETIO_CLIENTS = Gauge("orchestrator_socketio_clients", "Connected Socket.IO clients", ["namespace"])
+SOCKETIO_EMIT_SECONDS = Histogram("orchestrator_socketio_emit_seconds", "Time spent emitting a Socket.IO event", ["event"])
+
+# MongoDB
+MONGO_COMMAND_SECONDS = Histogram("orchestrator_mongo_command_seconds", "MongoDB command latency", ["collection", "command"])
+MONGO_COMMAND_FAILURES = Counter("orchestrator_mongo_command_failures_total", "Failed MongoDB commands", ["collection", "command"])
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records the latency of every MongoDB command per collection."""
+
+    def __init__(self) -> None:
+        self.pending: dict[tuple[object, int], tuple[str, str]] = {}
+
+    @staticmethod
+    def collection_of(event: monitoring.CommandStartedEvent) -> str:
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        return target if isinstance(target, str) else ""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self.pending[(event.connection_id, event.request_id)] = (self.collection_of(event), event.command_name)
+
+    def finished(self, event: Union[monitoring.CommandSucceededEvent, monitoring.CommandFailedEvent]) -> Optional[tuple[str, str]]:
+        labels = self.pending.pop((event.connection_id, event.request_id), None)
+        if labels:
+            MONGO_COMMAND_SECONDS.labels(*labels).observe(event.duration_micros / 1_000_000)
+        return labels
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self.finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        labels = self.finished(event)
+        if labels:
+            MONGO_COMMAND_FAILURES.labels(*labels).inc()
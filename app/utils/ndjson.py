@@ -0,0 +1,68 @@
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+
+from app.models import BatchIngestResult, BatchRecordError
+
+M = TypeVar("M", bound=BaseModel)
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def ingest_ndjson(
+    chunks: AsyncIterator[bytes],
+    model: type[M],
+    overrides: dict[str, Any],
+    write: Callable[[list[M]], Awaitable[None]],
+    batch_size: int
+) -> BatchIngestResult:
+    # Records are validated as they stream in and written every `batch_size`
+    # valid records; failures are reported by their line index in the body
+    result = BatchIngestResult(accepted=0, errors=[])
+    batch: list[M] = []
+    indexes: list[int] = []
+
+    async def flush() -> None:
+        try:
+            await write(batch)
+            result.accepted += len(batch)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            result.accepted += len(batch) - len(write_errors)
+            for write_error in write_errors:
+                result.errors.append(BatchRecordError(index=indexes[write_error["index"]], error=write_error.get("errmsg", "Write failed")))
+        except Exception as e:
+            result.errors.extend(BatchRecordError(index=index, error=f"Write failed: {e}") for index in indexes)
+        batch.clear()
+        indexes.clear()
+
+    index = -1
+    async for line in iter_ndjson_lines(chunks):
+        index += 1
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("Record must be a JSON object")
+            batch.append(model(**{**data, **overrides}))
+            indexes.append(index)
+        except (ValueError, ValidationError) as e:
+            result.errors.append(BatchRecordError(index=index, error=str(e)))
+            continue
+
+        if len(batch) >= batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+    result.errors.sort(key=lambda error: error.index)
+    return result
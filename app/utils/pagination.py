@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import Any, Optional, Sequence
+
+from bson import ObjectId
+from fastapi import HTTPException, Query, Response
+from pydantic import BaseModel
+
+from ..models import MongoModel
+from .config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+
+class PageQuery(BaseModel):
+    limit: int = DEFAULT_PAGE_SIZE
+    after: Optional[str] = None
+    before: Optional[str] = None
+    fields: Optional[list[str]] = None
+
+def page_query(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Return items that come after this cursor"),
+    before: Optional[str] = Query(None, description="Return items that come before this cursor"),
+    fields: Optional[str] = Query(None, description="Comma separated list of fields to return")
+) -> PageQuery:
+    for cursor in (after, before):
+        if cursor is not None and not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    return PageQuery(limit=limit, after=after, before=before, fields=field_list)
+
+def time_range(query: dict[str, Any], field: str, since: Optional[datetime], until: Optional[datetime]) -> dict[str, Any]:
+    bounds: dict[str, datetime] = {}
+    if since:
+        bounds["$gte"] = since
+    if until:
+        bounds["$lt"] = until
+    if bounds:
+        query[field] = bounds
+    return query
+
+def page_projection(model: type[MongoModel], page: PageQuery, excluded: Sequence[str] = ()) -> Optional[dict[str, int]]:
+    if not page.fields:
+        return {field: 0 for field in excluded} or None
+    # Required fields are always returned so documents still serialize
+    required = [field.alias for field in model.__fields__.values() if field.required]
+    return {field: 1 for field in [*required, *page.fields] if field not in excluded}
+
+async def find_page(collection: Any, query: dict[str, Any], page: PageQuery,
+                    descending: bool = False, projection: Optional[dict[str, int]] = None) -> list[dict[str, Any]]:
+    # Keyset pagination on _id: cursors are the ids of the first and last
+    # items of a page, so every page is an index range scan
+    query = dict(query)
+    id_bounds: dict[str, ObjectId] = {}
+    if page.after:
+        id_bounds["$lt" if descending else "$gt"] = ObjectId(page.after)
+    if page.before:
+        id_bounds["$gt" if descending else "$lt"] = ObjectId(page.before)
+    if id_bounds:
+        query["_id"] = id_bounds
+
+    # Walking backwards from `before` means reading in reverse order
+    backwards = bool(page.before and not page.after)
+    direction = -1 if descending != backwards else 1
+    cursor = collection.find(query, projection).sort("_id", direction).limit(page.limit)
+    documents: list[dict[str, Any]] = await cursor.to_list(length=page.limit)
+    if backwards:
+        documents.reverse()
+    return documents
+
+def set_page_headers(response: Response, items: Sequence[MongoModel], page: PageQuery) -> None:
+    if not items:
+        return
+    full_page = len(items) >= page.limit
+    if page.after or (page.before and full_page):
+        response.headers[PREV_CURSOR_HEADER] = items[0].id
+    if full_page or page.before:
+        response.headers[NEXT_CURSOR_HEADER] = items[-1].id
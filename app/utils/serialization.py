@@ -0,0 +1,78 @@
+from enum import Enum
+from typing import Any, Callable, Optional, TypeVar
+
+import orjson
+from bson import ObjectId
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON, ModelField
+from starlette.responses import JSONResponse
+
+from ..models import ObjectIdStr
+
+M = TypeVar("M", bound=BaseModel)
+
+# Documents read back from Mongo were validated on their way in, so models are
+# built from them without validating again. Only the conversions validation
+# would make are applied: ObjectIds to strings and stored values to enums.
+# Documents read with a field projection are built as partial models, which
+# hold (and serialize) only the fields the document has, not the defaults.
+
+FieldSpec = tuple[str, str, Optional[Callable[[Any], Any]]]
+model_fields: dict[type, list[FieldSpec]] = {}
+
+def field_converter(field: ModelField) -> Optional[Callable[[Any], Any]]:
+    if field.shape != SHAPE_SINGLETON or not isinstance(field.type_, type):
+        return None
+    if issubclass(field.type_, ObjectIdStr):
+        return str
+    if issubclass(field.type_, Enum):
+        return field.type_
+    return None
+
+def construct_model(model: type[M], doc: dict[str, Any], partial: bool = False) -> M:
+    fields = model_fields.get(model)
+    if fields is None:
+        fields = model_fields[model] = [
+            (name, field.alias, field_converter(field)) for name, field in model.__fields__.items()
+        ]
+    values: dict[str, Any] = {}
+    for name, alias, convert in fields:
+        if alias in doc:
+            value = doc[alias]
+            values[name] = convert(value) if convert and value is not None else value
+    instance = model.construct(_fields_set=set(values), **values)
+    if partial:
+        for name in set(instance.__dict__) - instance.__fields_set__:
+            del instance.__dict__[name]
+    return instance
+
+def encode_default(obj: Any) -> Any:
+    # Models are written with their aliases (_id), as FastAPI would; nested values
+    # come back through here or are handled by orjson itself
+    if isinstance(obj, BaseModel):
+        values = obj.__dict__
+        return {field.alias: values[name] for name, field in obj.__fields__.items() if name in values}
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=encode_default)
+
+# dumps/loads make this module usable as the json module of the Socket.IO server
+def dumps(obj: Any, **kwargs: Any) -> str:
+    return dumps_bytes(obj).decode()
+
+def loads(data: Any, **kwargs: Any) -> Any:
+    return orjson.loads(data)
+
+
+class ModelResponse(JSONResponse):
+    """JSON response that encodes models straight to bytes with orjson.
+
+    Returning it from an endpoint skips FastAPI's response_model validation and
+    jsonable_encoder pass, so only use it for models built from trusted data.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
@@ -0,0 +1,48 @@
+import math
+from typing import Mapping, Optional, Union
+
+
+class QuantileSketch:
+    """Log-bucketed quantile sketch in the style of DDSketch.
+
+    Bucket `k` holds the values in (gamma^(k-1), gamma^k], so any quantile is
+    answered within `relative_accuracy` of the true value. Sketches merge by
+    adding their bucket counts, which is what lets per-minute sketches stored
+    in Mongo be maintained with $inc and combined into hours and days.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-3) -> None:
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Values below min_value (including zero) all share its bucket
+        self.min_value = min_value
+        self.counts: dict[int, int] = {}
+        self.count = 0
+
+    def key(self, value: float) -> int:
+        return math.ceil(math.log(max(value, self.min_value)) / self.log_gamma)
+
+    def value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        key = self.key(value)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.count += count
+
+    def merge_counts(self, counts: Mapping[Union[str, int], int]) -> None:
+        # Bucket keys come back from Mongo as strings
+        for key, count in counts.items():
+            self.counts[int(key)] = self.counts.get(int(key), 0) + count
+            self.count += count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        cumulative = 0
+        for key in sorted(self.counts):
+            cumulative += self.counts[key]
+            if cumulative > rank:
+                return self.value(key)
+        return self.value(max(self.counts))
@@ -1,16 +1,77 @@
+import time
+from typing import Any, Optional, Union
+
 import socketio
 
+from . import serialization
+from .config import SOCKETIO_CHANNEL, SOCKETIO_MESSAGE_QUEUE
+from .local_pubsub import LocalPubSubManager
+from .metrics import SOCKETIO_CLIENTS, SOCKETIO_EMIT_SECONDS
+
+def create_client_manager(url: str) -> Optional[socketio.AsyncManager]:
+    # Without a message queue, emits only reach clients connected to this process
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return socketio.AsyncRedisManager(url, channel=SOCKETIO_CHANNEL)
+    if url.startswith(('amqp://', 'amqps://')):
+        return socketio.AsyncAioPikaManager(url, channel=SOCKETIO_CHANNEL)
+    if url.startswith('memory://'):
+        return LocalPubSubManager(channel=SOCKETIO_CHANNEL)
+    raise ValueError(f"Unsupported Socket.IO message queue: {url}")
+
 # Create a separate Socket.IO server with logging disabled
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', logger=False, engineio_logger=False)
+# Emitted models are encoded by the orjson based serialization module
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', logger=False, engineio_logger=False,
+                           client_manager=create_client_manager(SOCKETIO_MESSAGE_QUEUE), json=serialization)
 sio_app = socketio.ASGIApp(sio)
 
+# UI clients only receive what they subscribed to: the rooms of single runs,
+# bots or agents, or the summary room with run, bot and agent state changes
+# (but no logs or events) for fleet-wide views
+SUMMARY_ROOM = 'summary'
+
+def run_room(run_id: str) -> str:
+    return f'run:{run_id}'
+
+def bot_room(bot_id: str) -> str:
+    return f'bot:{bot_id}'
+
+def agent_room(agent_id: str) -> str:
+    return f'agent:{agent_id}'
+
+def ui_rooms(data: dict[str, Any]) -> list[str]:
+    rooms = []
+    if data.get('run_id'):
+        rooms.append(run_room(data['run_id']))
+    if data.get('bot_id'):
+        rooms.append(bot_room(data['bot_id']))
+    if data.get('agent_id'):
+        rooms.append(agent_room(data['agent_id']))
+    if data.get('summary'):
+        rooms.append(SUMMARY_ROOM)
+    return rooms
+
+def run_rooms(run_id: str, bot_id: str, agent_id: Optional[str]) -> list[str]:
+    rooms = [run_room(run_id), bot_room(bot_id), SUMMARY_ROOM]
+    if agent_id:
+        rooms.append(agent_room(agent_id))
+    return rooms
+
+async def emit_ui(event: str, data: Any, room: Union[str, list[str]]) -> None:
+    started = time.perf_counter()
+    await sio.emit(event, data, room=room, namespace='/ui')
+    SOCKETIO_EMIT_SECONDS.labels(event).observe(time.perf_counter() - started)
+
 # Socket.IO event handlers
 @sio.event
 async def connect(sid, environ) -> None:
+    SOCKETIO_CLIENTS.labels('/').inc()
     print('Client connected:', sid)
 
 @sio.event
 async def disconnect(sid) -> None:
+    SOCKETIO_CLIENTS.labels('/').dec()
     print('Client disconnected:', sid)
 
 @sio.event
@@ -28,35 +89,40 @@ async def leave(sid, data) -> None:
         print(f"Client {sid} left room {bot_id}")
 
 # Socket.IO event handlers for UI namespace
-@sio.event(namespace='/ui')
+@sio.on('connect', namespace='/ui')
 async def ui_connect(sid, environ) -> None:
+    SOCKETIO_CLIENTS.labels('/ui').inc()
     print('UI Client connected:', sid)
 
-@sio.event(namespace='/ui')
+@sio.on('disconnect', namespace='/ui')
 async def ui_disconnect(sid) -> None:
+    SOCKETIO_CLIENTS.labels('/ui').dec()
     print('UI Client disconnected:', sid)
 
 @sio.event(namespace='/ui')
 async def ui_join(sid, data) -> None:
-    bot_id = data.get('bot_id')
-    if bot_id:
-        await sio.enter_room(sid, bot_id, namespace='/ui')
-    print(f"UI Client {sid} joined room {bot_id}")
+    rooms = ui_rooms(data)
+    for room in rooms:
+        await sio.enter_room(sid, room, namespace='/ui')
+    print(f"UI Client {sid} joined rooms {rooms}")
 
 @sio.event(namespace='/ui')
 async def ui_leave(sid, data) -> None:
-    bot_id = data.get('bot_id')
-    if bot_id:
-        await sio.leave_room(sid, bot_id, namespace='/ui')
-        print(f"UI Client {sid} left room {bot_id}")
+    rooms = ui_rooms(data)
+    for room in rooms:
+        await sio.leave_room(sid, room, namespace='/ui')
+    if rooms:
+        print(f"UI Client {sid} left rooms {rooms}")
 
 # Socket.IO event handlers for agent namespace
-@sio.event(namespace='/agent')
+@sio.on('connect', namespace='/agent')
 async def agent_connect(sid, environ) -> None:
+    SOCKETIO_CLIENTS.labels('/agent').inc()
     print('Agent connected:', sid)
 
-@sio.event(namespace='/agent')
+@sio.on('disconnect', namespace='/agent')
 async def agent_disconnect(sid) -> None:
+    SOCKETIO_CLIENTS.labels('/agent').dec()
     print('Agent disconnected:', sid)
 
 @sio.event(namespace='/agent')
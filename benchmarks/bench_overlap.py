@@ -0,0 +1,113 @@
+"""Simulate an overloaded fleet to compare overlap policies by wasted agent-minutes.
+
+Run from the repository root with `python -m benchmarks.bench_overlap`.
+Slow bots fire every minute but run for several, so their runs pile up. A run
+counts as wasted when it starts while another run of the same bot is still in
+progress, or while a newer run of the same bot is already queued behind it
+(its result is superseded before it begins). The dispatcher is the real
+RunQueue and BotConcurrency, driven minute by minute.
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.models import OverlapPolicy, RunPriority
+from app.services.bot_concurrency import BotConcurrency
+from app.services.run_queue import RunQueue
+
+@dataclass
+class Bot:
+    bot_id: str
+    interval: int
+    runtime: int
+    max_concurrency: Optional[int]
+    policy: OverlapPolicy
+
+def simulate(bots: list[Bot], slots: int, minutes: int) -> dict[str, float]:
+    start = datetime(2024, 1, 1)
+    queue = RunQueue()
+    concurrency = BotConcurrency()
+    queued: dict[str, dict[str, int]] = {bot.bot_id: {} for bot in bots}
+    running: list[tuple[int, str]] = []
+    by_id = {bot.bot_id: bot for bot in bots}
+    wasted = useful = suppressed = 0
+    waits: list[int] = []
+    seq = 0
+
+    for minute in range(minutes):
+        # Finish runs, handing their bot slot back
+        for end, bot_id in [item for item in running if item[0] == minute]:
+            running.remove((end, bot_id))
+            concurrency.finish(bot_id)
+            queue.unpark(bot_id)
+
+        for bot in bots:
+            if minute % bot.interval:
+                continue
+            unfinished = len(queued[bot.bot_id]) + concurrency.count(bot.bot_id)
+            if bot.policy == OverlapPolicy.SKIP and unfinished >= (bot.max_concurrency or 1):
+                suppressed += 1
+                continue
+            if bot.policy == OverlapPolicy.REPLACE:
+                suppressed += len(queued[bot.bot_id])
+                queued[bot.bot_id].clear()
+            seq += 1
+            run_id = f"{bot.bot_id}-{seq}"
+            queued[bot.bot_id][run_id] = minute
+            queue.push(run_id, bot.bot_id, RunPriority.HIGH, start + timedelta(minutes=minute))
+
+        while len(running) < slots:
+            item = queue.pop()
+            if item is None:
+                break
+            bot = by_id[item.bot_id]
+            if item.run_id not in queued[bot.bot_id]:
+                continue  # cancelled by replace
+            if bot.max_concurrency and concurrency.count(bot.bot_id) >= bot.max_concurrency:
+                queue.park(bot.bot_id)
+                queue.push(item.run_id, item.bot_id, item.priority, item.start_time)
+                continue
+            fired = queued[bot.bot_id].pop(item.run_id)
+            redundant = concurrency.count(bot.bot_id) > 0 or any(newer > fired for newer in queued[bot.bot_id].values())
+            if redundant:
+                wasted += bot.runtime
+            else:
+                useful += bot.runtime
+            if bot.runtime <= bot.interval:
+                waits.append(minute - fired)
+            concurrency.start(bot.bot_id)
+            running.append((minute + bot.runtime, bot.bot_id))
+
+    waits.sort()
+    return {
+        "wasted": wasted,
+        "useful": useful,
+        "suppressed": suppressed,
+        "fast_p95_wait": waits[int(len(waits) * 0.95)] if waits else 0,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slow-bots", type=int, default=5)
+    parser.add_argument("--fast-bots", type=int, default=30)
+    parser.add_argument("--slots", type=int, default=10)
+    parser.add_argument("--minutes", type=int, default=240)
+    args = parser.parse_args()
+
+    configurations: list[tuple[str, Optional[int], OverlapPolicy]] = [
+        ("queue, unlimited (before)", None, OverlapPolicy.QUEUE),
+        ("queue, max_concurrency=1", 1, OverlapPolicy.QUEUE),
+        ("skip", 1, OverlapPolicy.SKIP),
+        ("replace, max_concurrency=1", 1, OverlapPolicy.REPLACE),
+    ]
+    for name, max_concurrency, policy in configurations:
+        # Slow bots fire every minute and run for 4; fast ones fire every 5 and run for 1
+        bots = [Bot(f"slow-{i}", 1, 4, max_concurrency, policy) for i in range(args.slow_bots)]
+        bots += [Bot(f"fast-{i}", 5, 1, None, OverlapPolicy.QUEUE) for i in range(args.fast_bots)]
+        result = simulate(bots, args.slots, args.minutes)
+        print(f"{name:28} wasted {result['wasted']:5} agent-min, useful {result['useful']:5} agent-min, "
+              f"suppressed {result['suppressed']:4}, fast bots' p95 wait {result['fast_p95_wait']} min")
+
+if __name__ == "__main__":
+    main()
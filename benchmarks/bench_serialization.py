@@ -0,0 +1,63 @@
+"""Compare serializing a page of runs the validated way and through the trusted path.
+
+Run from the repository root with `python -m benchmarks.bench_serialization`.
+The validated path is what list endpoints used to do: build models with full
+validation, let FastAPI validate them again against the response model, run
+jsonable_encoder and render with the standard json module. The trusted path
+builds the models with construct_model and renders them with ModelResponse.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.models import RunStatus, SerializedRun
+from app.utils.serialization import ModelResponse, construct_model
+
+def run_documents(count: int) -> list[dict[str, Any]]:
+    start = datetime(2024, 1, 1)
+    return [{
+        "_id": ObjectId(),
+        "bot_id": str(ObjectId()),
+        "agent_id": f"agent-{i % 20}",
+        "status": RunStatus.COMPLETED.value,
+        "start_time": start + timedelta(minutes=i),
+        "end_time": start + timedelta(minutes=i, seconds=42),
+        "scheduled_time": start + timedelta(minutes=i),
+    } for i in range(count)]
+
+async def validated(docs: list[dict[str, Any]]) -> bytes:
+    runs = [SerializedRun(**doc) for doc in docs]
+    field = create_response_field(name="Response", type_=list[SerializedRun])
+    content = await serialize_response(field=field, response_content=runs)
+    return JSONResponse(content).body
+
+async def trusted(docs: list[dict[str, Any]]) -> bytes:
+    return ModelResponse([construct_model(SerializedRun, doc) for doc in docs]).body
+
+def measure(path: Callable[[list[dict[str, Any]]], Any], docs: list[dict[str, Any]], rounds: int) -> float:
+    began = time.perf_counter()
+    for _ in range(rounds):
+        asyncio.run(path(docs))
+    return (time.perf_counter() - began) / rounds
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=1000, help="runs per page")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    docs = run_documents(args.runs)
+    validated_time = measure(validated, docs, args.rounds)
+    trusted_time = measure(trusted, docs, args.rounds)
+    print(f"validated: {validated_time * 1000:.1f}ms per {args.runs} runs")
+    print(f"trusted:   {trusted_time * 1000:.1f}ms per {args.runs} runs ({validated_time / trusted_time:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from bson import ObjectId
+
+from app.models import AgentStatus, SerializedAgent
+from app.services.agent_registry import AgentRegistry, agent_labels
+
+def make_agent(agent_id: str, slots: int = 1, labels: Any = None, status: AgentStatus = AgentStatus.AVAILABLE,
+               last_heartbeat: Optional[datetime] = None) -> SerializedAgent:
+    resources: dict[str, Any] = {"slots": slots}
+    if labels is not None:
+        resources["labels"] = labels
+    return SerializedAgent(_id=str(ObjectId()), agent_id=agent_id, status=status, resources=resources,
+                           public_url=f"http://{agent_id}", last_heartbeat=last_heartbeat or datetime.now())
+
+def registry_of(*agents: SerializedAgent) -> AgentRegistry:
+    registry = AgentRegistry()
+    registry.reset(list(agents), {})
+    return registry
+
+def test_labels_are_read_from_lists_and_mappings() -> None:
+    assert agent_labels(make_agent("a", labels=["chrome", "eu"])) == {"chrome", "eu"}
+    assert agent_labels(make_agent("a", labels={"browser": "chrome"})) == {"browser=chrome"}
+    assert agent_labels(make_agent("a")) == frozenset()
+
+def test_acquire_picks_the_least_loaded_agent() -> None:
+    registry = registry_of(make_agent("small", slots=1), make_agent("large", slots=3))
+    picked = [registry.acquire() for _ in range(4)]
+    assert [agent.agent_id for agent in picked if agent] == ["large", "large", "small", "large"]
+    assert registry.acquire() is None
+    assert registry.free_slots() == 0
+
+def test_acquire_only_returns_agents_with_every_required_label() -> None:
+    registry = registry_of(
+        make_agent("chrome", labels=["chrome"]),
+        make_agent("chrome-eu", labels=["chrome", "eu"]),
+        make_agent("firefox-eu", labels=["firefox", "eu"]),
+    )
+    agent = registry.acquire(frozenset({"chrome", "eu"}))
+    assert agent is not None and agent.agent_id == "chrome-eu"
+    assert registry.acquire(frozenset({"chrome", "eu"})) is None
+    assert registry.acquire(frozenset({"safari"})) is None
+    # Agents passed over for missing a label stay available
+    agent = registry.acquire(frozenset({"eu"}))
+    assert agent is not None and agent.agent_id == "firefox-eu"
+    agent = registry.acquire()
+    assert agent is not None and agent.agent_id == "chrome"
+
+def test_release_makes_the_slot_available_again() -> None:
+    registry = registry_of(make_agent("a", labels=["chrome"]))
+    assert registry.acquire(frozenset({"chrome"})) is not None
+    assert not registry.has_free()
+    registry.release("a")
+    assert registry.has_free()
+    assert registry.acquire(frozenset({"chrome"})) is not None
+
+def test_suspended_agents_return_on_their_next_update() -> None:
+    registry = registry_of(make_agent("a", slots=2))
+    registry.suspend("a")
+    assert registry.acquire() is None
+    registry.update("a", {"last_heartbeat": datetime.now()})
+    assert registry.acquire() is not None
+
+def test_agents_with_stale_heartbeats_are_skipped() -> None:
+    registry = registry_of(make_agent("stale", slots=5, last_heartbeat=datetime.now() - timedelta(hours=1)),
+                           make_agent("fresh"))
+    agent = registry.acquire()
+    assert agent is not None and agent.agent_id == "fresh"
+    assert registry.acquire() is None
+
+def test_label_changes_move_the_agent_in_the_index() -> None:
+    registry = registry_of(make_agent("a", labels=["chrome"]))
+    registry.update("a", {"resources": {"slots": 1, "labels": ["firefox"]}})
+    assert registry.acquire(frozenset({"chrome"})) is None
+    assert registry.acquire(frozenset({"firefox"})) is not None
+
+def test_busy_and_offline_agents_are_not_acquired() -> None:
+    registry = registry_of(make_agent("busy", status=AgentStatus.BUSY), make_agent("a"))
+    registry.update("a", {"status": AgentStatus.OFFLINE})
+    assert registry.acquire() is None
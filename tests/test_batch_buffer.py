@@ -0,0 +1,76 @@
+import asyncio
+
+from app.utils.batch_buffer import BatchBuffer
+
+def make_buffer(batches: list[list[int]], max_batch: int = 20, max_delay: float = 0.05,
+                max_pending: int = 50) -> BatchBuffer[int]:
+    async def flush(batch: list[int]) -> None:
+        await asyncio.sleep(0)
+        batches.append(list(batch))
+    return BatchBuffer("test", flush, max_batch, max_delay, max_pending)
+
+def test_items_are_flushed_in_bounded_batches() -> None:
+    batches: list[list[int]] = []
+
+    async def run() -> None:
+        buffer = make_buffer(batches)
+        buffer.start()
+        for i in range(95):
+            await buffer.put(i)
+        await asyncio.sleep(0.2)
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert [item for batch in batches for item in batch] == list(range(95))
+    assert all(len(batch) <= 20 for batch in batches)
+
+def test_a_partial_batch_is_flushed_after_the_delay() -> None:
+    batches: list[list[int]] = []
+
+    async def run() -> None:
+        buffer = make_buffer(batches, max_delay=0.01)
+        buffer.start()
+        await buffer.put(1)
+        await asyncio.sleep(0.1)
+        assert batches == [[1]]
+        await buffer.stop()
+
+    asyncio.run(run())
+
+def test_stop_drains_everything_queued_including_blocked_producers() -> None:
+    batches: list[list[int]] = []
+
+    async def run() -> None:
+        buffer = make_buffer(batches, max_batch=200, max_delay=0.5)
+        buffer.start()
+        producers = [asyncio.create_task(buffer.put(i)) for i in range(1000)]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(buffer.stop(), 5)
+        await asyncio.wait_for(asyncio.gather(*producers), 5)
+        assert not buffer.running
+
+    asyncio.run(run())
+    assert sorted(item for batch in batches for item in batch) == list(range(1000))
+
+def test_put_flushes_directly_when_not_running() -> None:
+    batches: list[list[int]] = []
+    asyncio.run(make_buffer(batches).put(7))
+    assert batches == [[7]]
+
+def test_flush_errors_do_not_stop_the_buffer() -> None:
+    flushed: list[int] = []
+
+    async def flush(batch: list[int]) -> None:
+        if 0 in batch:
+            raise RuntimeError("write failed")
+        flushed.extend(batch)
+
+    async def run() -> None:
+        buffer: BatchBuffer[int] = BatchBuffer("test", flush, 1, 0.01, 10)
+        buffer.start()
+        for i in range(3):
+            await buffer.put(i)
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert flushed == [1, 2]
@@ -0,0 +1,46 @@
+import random
+
+from app.services.bot_version_service import apply_delta, encode_delta
+
+SCRIPT = "".join(f"driver.find_element(By.ID, 'field-{i}').click()\n" for i in range(200))
+
+def round_trip(previous: str, script: str) -> str:
+    return apply_delta(previous, encode_delta(previous, script))
+
+def test_delta_round_trips_edits() -> None:
+    lines = SCRIPT.splitlines(keepends=True)
+    edited = lines[:50] + ["time.sleep(1)\n"] + lines[60:150] + lines[170:] + ["driver.quit()\n"]
+    assert round_trip(SCRIPT, "".join(edited)) == "".join(edited)
+
+def test_delta_round_trips_edge_cases() -> None:
+    for previous, script in [
+        ("", SCRIPT),
+        (SCRIPT, ""),
+        (SCRIPT, SCRIPT),
+        (SCRIPT, SCRIPT.rstrip("\n")),
+        ("a\r\nb\r\n", "a\r\nc\r\n"),
+        ("no newline", "no newline at all"),
+    ]:
+        assert round_trip(previous, script) == script
+
+def test_delta_round_trips_random_edits() -> None:
+    rng = random.Random(42)
+    script = SCRIPT
+    for _ in range(50):
+        lines = script.splitlines(keepends=True)
+        for _ in range(rng.randint(1, 5)):
+            i = rng.randrange(len(lines) + 1)
+            action = rng.choice(["insert", "delete", "replace"])
+            if action == "insert" or not lines:
+                lines.insert(i, f"step_{rng.random()}()\n")
+            elif action == "delete":
+                del lines[min(i, len(lines) - 1)]
+            else:
+                lines[min(i, len(lines) - 1)] = f"changed_{rng.random()}()\n"
+        edited = "".join(lines)
+        assert round_trip(script, edited) == edited
+        script = edited
+
+def test_small_edit_gives_a_small_delta() -> None:
+    edited = SCRIPT.replace("field-100", "field-100b")
+    assert len(encode_delta(SCRIPT, edited)) < 200
@@ -0,0 +1,90 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.models import RunPriority
+from app.services.run_queue import RunQueue
+
+START = datetime(2024, 1, 1)
+WEIGHTS = {"high": 8.0, "normal": 2.0, "low": 1.0}
+
+def push_runs(queue: RunQueue, bot_id: str, count: int, priority: RunPriority = RunPriority.NORMAL) -> None:
+    for i in range(count):
+        queue.push(f"{bot_id}-{i}", bot_id, priority, START + timedelta(seconds=i))
+
+def drain(queue: RunQueue) -> list[str]:
+    popped = []
+    while (item := queue.pop()) is not None:
+        popped.append(item.run_id)
+    return popped
+
+def test_runs_of_a_bot_come_out_oldest_first() -> None:
+    queue = RunQueue(WEIGHTS)
+    for i in (3, 1, 2):
+        queue.push(f"run-{i}", "bot", RunPriority.NORMAL, START + timedelta(seconds=i))
+    assert drain(queue) == ["run-1", "run-2", "run-3"]
+    assert len(queue) == 0
+
+def test_pushing_a_queued_run_again_is_ignored() -> None:
+    queue = RunQueue(WEIGHTS)
+    queue.push("run", "bot", RunPriority.NORMAL, START)
+    queue.push("run", "bot", RunPriority.NORMAL, START)
+    assert len(queue) == 1
+    assert drain(queue) == ["run"]
+
+def test_bots_of_a_class_take_turns() -> None:
+    # A bot with a large backlog only delays another bot by one run
+    queue = RunQueue(WEIGHTS)
+    push_runs(queue, "busy", 100)
+    push_runs(queue, "quiet", 3)
+    popped = drain(queue)
+    assert all(popped.index(f"quiet-{i}") <= 2 * i + 1 for i in range(3))
+    assert len(popped) == 103
+
+def test_a_bot_that_was_idle_cannot_burst() -> None:
+    queue = RunQueue(WEIGHTS)
+    push_runs(queue, "busy", 50)
+    for _ in range(20):
+        queue.pop()
+    push_runs(queue, "late", 10)
+    first = [queue.pop() for _ in range(6)]
+    assert Counter(item.bot_id for item in first if item) == {"busy": 3, "late": 3}
+
+def test_classes_share_dispatches_by_weight() -> None:
+    queue = RunQueue(WEIGHTS)
+    for priority in RunPriority:
+        push_runs(queue, f"bot-{priority.value}", 1000, priority)
+    shares = Counter(item.priority for item in (queue.pop() for _ in range(1100)) if item)
+    assert shares[RunPriority.HIGH] == 800
+    assert shares[RunPriority.NORMAL] == 200
+    assert shares[RunPriority.LOW] == 100
+
+def test_high_priority_run_is_not_stuck_behind_a_backlog() -> None:
+    queue = RunQueue(WEIGHTS)
+    push_runs(queue, "backlog", 500, RunPriority.LOW)
+    for _ in range(10):
+        queue.pop()
+    queue.push("urgent", "check", RunPriority.HIGH, START)
+    next_two = [queue.pop() for _ in range(2)]
+    assert "urgent" in [item.run_id for item in next_two if item]
+
+def test_parked_bots_are_passed_over_until_unparked() -> None:
+    queue = RunQueue(WEIGHTS)
+    push_runs(queue, "limited", 3)
+    push_runs(queue, "free", 3)
+    queue.park("limited")
+    assert drain(queue) == ["free-0", "free-1", "free-2"]
+    assert len(queue) == 3
+
+    assert queue.unpark("limited")
+    assert not queue.unpark("limited")
+    assert drain(queue) == ["limited-0", "limited-1", "limited-2"]
+
+def test_unpark_all_releases_every_parked_bot() -> None:
+    queue = RunQueue(WEIGHTS)
+    push_runs(queue, "a", 1)
+    push_runs(queue, "b", 1, RunPriority.HIGH)
+    queue.park("a")
+    queue.park("b")
+    assert queue.pop() is None
+    queue.unpark_all()
+    assert sorted(drain(queue)) == ["a-0", "b-0"]
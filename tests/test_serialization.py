@@ -0,0 +1,29 @@
+import orjson
+from bson import ObjectId
+
+from app.models import RunPriority, RunStatus, SerializedRun
+from app.utils.serialization import construct_model, dumps_bytes
+
+RUN_ID = ObjectId()
+
+def test_documents_are_built_with_converted_values() -> None:
+    run = construct_model(SerializedRun, {"_id": RUN_ID, "bot_id": "bot", "status": "queued", "priority": "high"})
+    assert run.id == str(RUN_ID)
+    assert run.status is RunStatus.QUEUED
+    assert run.priority is RunPriority.HIGH
+
+def test_full_documents_serialize_defaults() -> None:
+    run = construct_model(SerializedRun, {"_id": RUN_ID, "bot_id": "bot", "status": "queued"})
+    encoded = orjson.loads(dumps_bytes(run))
+    assert encoded["_id"] == str(RUN_ID)
+    assert encoded["priority"] == "normal"
+    assert "agent_id" in encoded and encoded["agent_id"] is None
+
+def test_partial_documents_serialize_only_their_fields() -> None:
+    run = construct_model(SerializedRun, {"_id": RUN_ID, "bot_id": "bot", "status": "running"}, partial=True)
+    assert orjson.loads(dumps_bytes([run])) == [{"_id": str(RUN_ID), "bot_id": "bot", "status": "running"}]
+
+def test_partial_documents_keep_projected_values() -> None:
+    run = construct_model(SerializedRun, {"_id": RUN_ID, "bot_id": "bot", "status": "running", "priority": "high"},
+                          partial=True)
+    assert orjson.loads(dumps_bytes(run))["priority"] == "high"
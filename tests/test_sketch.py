@@ -0,0 +1,46 @@
+import random
+
+from app.utils.sketch import QuantileSketch
+
+ACCURACY = 0.01
+
+def exact_quantile(values: list[float], q: float) -> float:
+    return sorted(values)[int(q * (len(values) - 1))]
+
+def test_quantiles_are_within_relative_accuracy() -> None:
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1.5) for _ in range(20000)]
+    sketch = QuantileSketch(ACCURACY)
+    for value in values:
+        sketch.add(value)
+    for q in (0.01, 0.5, 0.9, 0.95, 0.99, 1.0):
+        estimate = sketch.quantile(q)
+        exact = exact_quantile(values, q)
+        assert estimate is not None
+        assert abs(estimate - exact) <= ACCURACY * exact * 1.0001
+
+def test_empty_sketch_has_no_quantiles() -> None:
+    assert QuantileSketch(ACCURACY).quantile(0.5) is None
+
+def test_values_below_the_minimum_share_its_bucket() -> None:
+    sketch = QuantileSketch(ACCURACY, min_value=1e-3)
+    sketch.add(0.0)
+    sketch.add(1e-6)
+    assert len(sketch.counts) == 1
+    estimate = sketch.quantile(0.5)
+    assert estimate is not None and estimate <= 1e-3 * (1 + ACCURACY)
+
+def test_merged_counts_match_a_single_sketch() -> None:
+    # Buckets come back from Mongo with string keys
+    rng = random.Random(3)
+    values = [rng.uniform(0.1, 600) for _ in range(5000)]
+    whole, merged = QuantileSketch(ACCURACY), QuantileSketch(ACCURACY)
+    for part in (values[:1000], values[1000:]):
+        sketch = QuantileSketch(ACCURACY)
+        for value in part:
+            sketch.add(value)
+            whole.add(value)
+        merged.merge_counts({str(key): count for key, count in sketch.counts.items()})
+    assert merged.count == whole.count
+    assert merged.counts == whole.counts
+    assert merged.quantile(0.95) == whole.quantile(0.95)